@@ -16,3 +16,6 @@ MODULE_PANDAS_AVAILABLE = loader is not None
 
 loader = importlib.util.find_spec("cjvalpy")
 MODULE_CJVAL_AVAILABLE = loader is not None
+
+loader = importlib.util.find_spec("orjson")
+MODULE_ORJSON_AVAILABLE = loader is not None
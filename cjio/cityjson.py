@@ -1,4 +1,3 @@
-import copy
 import json
 import math
 import os
@@ -8,8 +7,10 @@ import shutil
 import sys
 import urllib.request
 import uuid
+from collections import Counter
 from datetime import datetime
-from io import StringIO
+from itertools import chain, islice
+from io import BufferedIOBase, RawIOBase, StringIO
 from pathlib import Path
 
 import numpy as np
@@ -17,16 +18,13 @@ from click import progressbar
 
 from cjio import errors, convert, geom_help, subset
 from cjio.errors import CJInvalidOperation
-from cjio.floatEncoder import FloatEncoder
 
 from cjio import (
     MODULE_PYPROJ_AVAILABLE,
     MODULE_CJVAL_AVAILABLE,
+    MODULE_ORJSON_AVAILABLE,
 )
 
-json.encoder.c_make_encoder = None
-json.encoder.float = FloatEncoder
-
 if MODULE_PYPROJ_AVAILABLE:
     from pyproj import CRS
     from pyproj.transformer import TransformerGroup
@@ -34,8 +32,27 @@ if MODULE_PYPROJ_AVAILABLE:
 if MODULE_CJVAL_AVAILABLE:
     import cjvalpy
 
+if MODULE_ORJSON_AVAILABLE:
+    import orjson
+
 
 CITYJSON_VERSIONS_SUPPORTED = ["0.6", "0.8", "0.9", "1.0", "1.1", "2.0"]
+CITYJSON_VERSION_LATEST = CITYJSON_VERSIONS_SUPPORTED[-1]
+# -- for the membership tests
+_CITYJSON_VERSIONS_SET = frozenset(CITYJSON_VERSIONS_SUPPORTED)
+
+# -- number of nested lists above the surfaces in the boundaries of a geometry
+SURFACE_DEPTHS = {
+    "MultiSurface": 1,
+    "CompositeSurface": 1,
+    "Solid": 2,
+    "MultiSolid": 3,
+    "CompositeSolid": 3,
+}
+
+# -- correct pattern for version, and wrong pattern with X.Y.Z
+VERSION_PATTERN = re.compile(r"\d\.\d")
+VERSION_PATTERN_XYZ = re.compile(r"\d\.\d\.\d")
 
 CITYJSON_PROPERTIES = [
     "type",
@@ -51,32 +68,90 @@ CITYJSON_PROPERTIES = [
 
 
 def read_stdin():
-    lcount = 1
+    # -- orjson parses the bytes of each line directly, without decoding first
+    loads = orjson.loads if MODULE_ORJSON_AVAILABLE else json.loads
+    stdin = sys.stdin.buffer
     # -- read first line
-    j1 = json.loads(sys.stdin.readline())
+    j1 = loads(stdin.readline())
     cm = CityJSON(j=j1)
     if "CityObjects" not in cm.j:
         cm.j["CityObjects"] = {}
     if "vertices" not in cm.j:
         cm.j["vertices"] = []
-    while True:
-        lcount += 1
-        line = sys.stdin.readline()
-        if line != "":
-            j1 = json.loads(line)
-            if not ("type" in j1 and j1["type"] == "CityJSONFeature"):
-                raise IOError(
-                    "Line {} is not of type 'CityJSONFeature'.".format(lcount)
-                )
-            cm.add_cityjsonfeature(j1)
-        else:
-            cm.remove_duplicate_vertices()
-            cm.remove_orphan_vertices()
-            cm.update_bbox()
-            break
+    for lcount, line in enumerate(stdin, start=2):
+        j1 = loads(line)
+        if not ("type" in j1 and j1["type"] == "CityJSONFeature"):
+            raise IOError("Line {} is not of type 'CityJSONFeature'.".format(lcount))
+        cm.add_cityjsonfeature(j1)
+    # -- clean once all the features are added
+    cm._remap_and_compact_vertices()
+    cm.update_bbox()
     return cm
 
 
+def dumps(j, indent=None):
+    """Serialise a CityJSON object (or a CityJSONFeature) to a JSON string.
+
+    The floats of the vertices (when not compressed) and of the
+    geographicalExtent are rounded to 6 decimals. orjson is used when it is
+    installed, unless the output must be indented.
+    """
+    j = round_floats(j)
+    if indent is not None:
+        return json.dumps(j, indent=indent, ensure_ascii=False)
+    return _dumps_compact(j)
+
+
+def _dumps_compact(j):
+    """Compact JSON string of j, as is (no rounding of the floats)."""
+    if MODULE_ORJSON_AVAILABLE:
+        return orjson.dumps(j).decode("utf-8")
+    return json.dumps(j, separators=(",", ":"), ensure_ascii=False)
+
+
+def _dumpb_compact(j):
+    """Same as _dumps_compact(), but encoded in UTF-8 (orjson's bytes as they are)."""
+    if MODULE_ORJSON_AVAILABLE:
+        return orjson.dumps(j)
+    return json.dumps(j, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def round_floats(j, digits=6):
+    """Return a shallow copy of j with its float coordinates rounded.
+
+    The input is not modified, only the members that are rounded are copied.
+    """
+    j2 = dict(j)
+    if "transform" not in j and len(j.get("vertices", [])) > 0:
+        try:
+            v = np.asarray(j["vertices"])
+        except ValueError:
+            v = None
+        if v is None or v.dtype.kind == "O":
+            # -- ragged or malformed vertices, rounded one by one
+            j2["vertices"] = [
+                [round(c, digits) if isinstance(c, float) else c for c in each]
+                if isinstance(each, list)
+                else each
+                for each in j["vertices"]
+            ]
+        elif v.dtype.kind == "f":
+            j2["vertices"] = np.round(v, digits).tolist()
+    if "metadata" in j and "geographicalExtent" in j["metadata"]:
+        j2["metadata"] = dict(j["metadata"])
+        j2["metadata"]["geographicalExtent"] = [
+            round(each, digits) for each in j["metadata"]["geographicalExtent"]
+        ]
+    return j2
+
+
+def json_copy(j):
+    """Deep copy of a JSON-like object, with a (much faster) JSON round-trip."""
+    if MODULE_ORJSON_AVAILABLE:
+        return orjson.loads(orjson.dumps(j))
+    return json.loads(json.dumps(j))
+
+
 def reader(file, ignore_duplicate_keys=False):
     return CityJSON(file=file, ignore_duplicate_keys=ignore_duplicate_keys)
 
@@ -87,19 +162,18 @@ def off2cj(file):
         line = file.readline()
     numVertices = int(line.split()[0])
     numFaces = int(line.split()[1])
-    lstVertices = []
-    for i in range(numVertices):
-        lstVertices.append(list(map(float, file.readline().split())))
+    # -- parse the whole block of vertices at once (the file is left right after it)
+    lstVertices = np.loadtxt(
+        file, usecols=(0, 1, 2), max_rows=numVertices, ndmin=2
+    ).tolist()
     lstFaces = []
     for i in range(numFaces):
         lstFaces.append(list(map(int, file.readline().split()[1:])))
     cm = {}
     cm["type"] = "CityJSON"
-    cm["version"] = CITYJSON_VERSIONS_SUPPORTED[-1]
+    cm["version"] = CITYJSON_VERSION_LATEST
     cm["CityObjects"] = {}
-    cm["vertices"] = []
-    for v in lstVertices:
-        cm["vertices"].append(v)
+    cm["vertices"] = lstVertices
     g = {"type": "Solid"}
     shell = []
     for f in lstFaces:
@@ -130,7 +204,7 @@ def poly2cj(file):
         raise ValueError("Invalid file: No content found.")
     numVertices = int(first_line.split()[0])
 
-    lstVertices = []
+    lines = []
     index = 0  # change depending the index used in the poly file
     for i in range(numVertices):
         line = read_next_line()
@@ -141,7 +215,9 @@ def poly2cj(file):
 
         if i == 0 and line.startswith("1"):
             index = -1
-        lstVertices.append(list(map(float, line.split()))[1:])
+        lines.append(line)
+    # -- parse all the vertices at once, the first column is the index
+    lstVertices = np.loadtxt(lines, ndmin=2)[:, 1:].tolist()
 
     line = read_next_line()
     if line is None:
@@ -165,11 +241,9 @@ def poly2cj(file):
         lstFaces.append(face)
     cm = {}
     cm["type"] = "CityJSON"
-    cm["version"] = CITYJSON_VERSIONS_SUPPORTED[-1]
+    cm["version"] = CITYJSON_VERSION_LATEST
     cm["CityObjects"] = {}
-    cm["vertices"] = []
-    for v in lstVertices:
-        cm["vertices"].append(v)
+    cm["vertices"] = lstVertices
     g = {"type": "Solid"}
     shell = []
     for f in lstFaces:
@@ -184,25 +258,80 @@ def poly2cj(file):
     return j
 
 
-def update_geom_indices(a, offset):
-    for i, each in enumerate(a):
-        if isinstance(each, list):
-            update_geom_indices(each, offset)
+def flatten(a):
+    """Yield the (non-null) indices of a nested boundary array, in order.
+
+    Iterative, so deeply nested (Multi)Solid boundaries don't pay for one Python
+    frame per level.
+    """
+    stack = [iter(a)]
+    while stack:
+        for each in stack[-1]:
+            if isinstance(each, list):
+                stack.append(iter(each))
+                break
+            elif each is not None:
+                yield each
+        else:
+            stack.pop()
+
+
+def rings(a):
+    """Yield the innermost lists (the rings of indices) of a nested boundary array.
+
+    The rings come out in the same order as their indices in :py:func:`flatten`,
+    so whole rings can be read or rewritten at once.
+    """
+    if not a or not isinstance(a[0], list):
+        yield a
+        return
+    stack = [iter(a)]
+    while stack:
+        for each in stack[-1]:
+            if each and isinstance(each[0], list):
+                stack.append(iter(each))
+                break
+            yield each
         else:
-            if each is not None:
-                a[i] = each + offset
+            stack.pop()
+
+
+def fresh_lists(a):
+    """Copy of a list of values and of (empty) lists, each list being a new one.
+
+    Used by triangulate() to start the material/texture lists of each shell
+    and solid, instead of a deepcopy.
+    """
+    return [[] if isinstance(each, list) else each for each in a]
+
+
+def update_geom_indices(a, offset):
+    # -- eg the first feature added to an empty model
+    if offset == 0:
+        return
+    # -- nested lists go on a stack, null and the indices can be mixed with them
+    stack = [a]
+    while stack:
+        arr = stack.pop()
+        for i, each in enumerate(arr):
+            if isinstance(each, list):
+                stack.append(each)
+            elif each is not None:
+                arr[i] = each + offset
 
 
 def update_texture_indices(a, toffset, voffset):
-    for i, each in enumerate(a):
-        if isinstance(each, list):
-            update_texture_indices(each, toffset, voffset)
-        else:
-            if each is not None:
-                if i == 0:
-                    a[i] = each + toffset
-                else:
-                    a[i] = each + voffset
+    if toffset == 0 and voffset == 0:
+        return
+    # -- in each ring the first index is the texture, the others are vertices
+    stack = [a]
+    while stack:
+        arr = stack.pop()
+        for i, each in enumerate(arr):
+            if isinstance(each, list):
+                stack.append(each)
+            elif each is not None:
+                arr[i] = each + (toffset if i == 0 else voffset)
 
 
 class CityJSON:
@@ -222,7 +351,7 @@ class CityJSON:
         else:  # -- create an empty one
             self.j = {}
             self.j["type"] = "CityJSON"
-            self.j["version"] = CITYJSON_VERSIONS_SUPPORTED[-1]
+            self.j["version"] = CITYJSON_VERSION_LATEST
             self.j["CityObjects"] = {}
             self.j["vertices"] = []
             self.cityobjects = {}
@@ -236,31 +365,30 @@ class CityJSON:
         return self.j["version"]
 
     def check_version(self):
-        if not isinstance(self.get_version(), str):
+        version = self.get_version()
+        if not isinstance(version, str):
             str1 = "CityJSON version should be a string 'X.Y' (eg '1.0')"
             raise errors.CJInvalidVersion(str1)
-        pattern = re.compile(r"^(\d\.)(\d)$")  # -- correct pattern for version
-        pattern2 = re.compile(r"^(\d\.)(\d\.)(\d)$")  # -- wrong pattern with X.Y.Z
-        if pattern.fullmatch(self.get_version()) is None:
-            if pattern2.fullmatch(self.get_version()) is not None:
+        if VERSION_PATTERN.fullmatch(version) is None:
+            if VERSION_PATTERN_XYZ.fullmatch(version) is not None:
                 str1 = "CityJSON version should be only X.Y (eg '1.0') and not X.Y.Z (eg '1.0.1')"
                 raise errors.CJInvalidVersion(str1)
             else:
                 str1 = "CityJSON version is wrongly formatted"
                 raise errors.CJInvalidVersion(str1)
-        if self.get_version() not in CITYJSON_VERSIONS_SUPPORTED:
+        if version not in _CITYJSON_VERSIONS_SET:
             allv = ""
             for v in CITYJSON_VERSIONS_SUPPORTED:
                 allv = allv + v + "/"
             str1 = (
                 "CityJSON version %s not supported (only versions: %s), not every operators will work.\nPerhaps it's time to upgrade cjio? 'pip install cjio -U'"
-                % (self.get_version(), allv)
+                % (version, allv)
             )
             raise errors.CJInvalidVersion(str1)
-        elif self.get_version() != CITYJSON_VERSIONS_SUPPORTED[-1]:
+        elif version != CITYJSON_VERSION_LATEST:
             str1 = (
                 "v%s is not the latest version, and not everything will work.\n"
-                % self.get_version()
+                % version
             )
             str1 += "Upgrade the file with 'upgrade' command: 'cjio input.json upgrade save out.json'"
             errors.CJWarning(str1).warn()
@@ -287,10 +415,25 @@ class CityJSON:
     def is_transform(self):
         return "transform" in self.j
 
+    def apply_transform(self, v):
+        """Apply the "transform" (if any) to an array of vertices.
+
+        :param v: NumPy array of shape (3,) or (N, 3)
+        :returns: the real-world coordinates as a NumPy array
+        """
+        if "transform" not in self.j:
+            return v
+        s = np.asarray(self.j["transform"]["scale"])
+        t = np.asarray(self.j["transform"]["translate"])
+        return v * s + t
+
     def read(self, file, ignore_duplicate_keys=False):
         if ignore_duplicate_keys:
             try:
-                self.j = json.loads(file.read())
+                if MODULE_ORJSON_AVAILABLE:
+                    self.j = orjson.loads(file.read())
+                else:
+                    self.j = json.loads(file.read())
             except json.decoder.JSONDecodeError as err:
                 raise err
         else:
@@ -308,28 +451,33 @@ class CityJSON:
             raise ValueError("Not a CityJSON file")
 
     def dict_raise_on_duplicates(self, ordered_pairs):
-        d = {}
+        d = dict(ordered_pairs)
+        if len(d) == len(ordered_pairs):
+            return d
+        # -- there is a duplicate, find it for the error message
+        keys = set()
         for k, v in ordered_pairs:
-            if k in d:
+            if k in keys:
                 raise ValueError(
                     "Invalid CityJSON file, duplicate key for City Object IDs: %r" % (k)
                 )
-            else:
-                d[k] = v
-        return d
+            keys.add(k)
 
     def validate(self):
         # -- only latest version, otherwise a mess with versions and different schemas
         # -- this is it, sorry people
-        if self.j["version"] != CITYJSON_VERSIONS_SUPPORTED[-1]:
-            s = (
-                "Only files with version v%s can be validated. "
-                % (CITYJSON_VERSIONS_SUPPORTED[-1])
+        if self.j["version"] != CITYJSON_VERSION_LATEST:
+            s = "Only files with version v%s can be validated. " % (
+                CITYJSON_VERSION_LATEST
             )
             raise Exception(s)
-        val = cjvalpy.CJValidator(json.dumps(self.j))
+        if not MODULE_CJVAL_AVAILABLE:
+            raise ModuleNotFoundError(
+                "Module 'cjvalpy' is not available, please install it"
+            )
+        # -- the file is the first document, followed by its extensions
+        js = [dumps(self.j)]
         # -- fetch extensions from the URLs given
-        js = []
         if "extensions" in self.j:
             for ext in self.j["extensions"]:
                 # theurl = self.j["extensions"][ext]["url"]
@@ -343,10 +491,6 @@ class CityJSON:
                         % self.j["extensions"][ext]["url"]
                     )
                     raise exp
-        if not MODULE_CJVAL_AVAILABLE:
-            raise ModuleNotFoundError(
-                "Module 'cjvalpy' is not available, please install it"
-            )
         val = cjvalpy.CJValidator(js)
         val.validate()
         re = val.get_report()
@@ -365,13 +509,9 @@ class CityJSON:
         """
         if len(self.j["vertices"]) == 0:
             return [0, 0, 0, 0, 0, 0]
-        x, y, z = zip(*self.j["vertices"])
-        bbox = [min(x), min(y), min(z), max(x), max(y), max(z)]
-        if "transform" in self.j:
-            s = self.j["transform"]["scale"]
-            t = self.j["transform"]["translate"]
-            bbox = [a * b + c for a, b, c in zip(bbox, (s + s), (t + t))]
-        return bbox
+        v = np.asarray(self.j["vertices"])
+        bbox = self.apply_transform(np.vstack((v.min(axis=0), v.max(axis=0))))
+        return bbox.ravel().tolist()
 
     def update_metadata(self):
         self.update_bbox()
@@ -419,77 +559,38 @@ class CityJSON:
         return True
 
     def update_bbox_each_cityobjects(self, addifmissing=False):
-        def recusionvisit(a, vs):
-            for each in a:
-                if isinstance(each, list):
-                    recusionvisit(each, vs)
-                else:
-                    vs.append(each)
-
-        for co in self.j["CityObjects"]:
-            if addifmissing or "geographicalExtent" in self.j["CityObjects"][co]:
-                vs = []
-                bbox = [9e9, 9e9, 9e9, -9e9, -9e9, -9e9]
-                if "geometry" in self.j["CityObjects"][co]:
-                    for g in self.j["CityObjects"][co]["geometry"]:
-                        recusionvisit(g["boundaries"], vs)
-                        for each in vs:
-                            v = self.j["vertices"][each]
-                            for i in range(3):
-                                if v[i] < bbox[i]:
-                                    bbox[i] = v[i]
-                            for i in range(3):
-                                if v[i] > bbox[i + 3]:
-                                    bbox[i + 3] = v[i]
-                        if "transform" in self.j:
-                            for i in range(3):
-                                bbox[i] = (
-                                    bbox[i] * self.j["transform"]["scale"][i]
-                                ) + self.j["transform"]["translate"][i]
-                            for i in range(3):
-                                bbox[i + 3] = (
-                                    bbox[i + 3] * self.j["transform"]["scale"][i]
-                                ) + self.j["transform"]["translate"][i]
-                        self.j["CityObjects"][co]["geographicalExtent"] = bbox
+        """
+        Update the geographicalExtent of the CityObjects that have one (or of all
+        of them with addifmissing). CityObjects without any vertex, ie without
+        geometry or with empty boundaries, are left as they are.
+        """
+        coids = [
+            coid
+            for coid, co in self.j["CityObjects"].items()
+            if addifmissing or "geographicalExtent" in co
+        ]
+        ids, verts, offsets = self._gather_vertices(coids)
+        if len(ids) == 0:
+            return
+        bboxes = np.hstack(
+            (
+                self.apply_transform(np.minimum.reduceat(verts, offsets, axis=0)),
+                self.apply_transform(np.maximum.reduceat(verts, offsets, axis=0)),
+            )
+        )
+        for coid, bbox in zip(ids, bboxes.tolist()):
+            self.j["CityObjects"][coid]["geographicalExtent"] = bbox
 
     def get_centroid(self, coid):
-        def recusionvisit(a, vs):
-            for each in a:
-                if isinstance(each, list):
-                    recusionvisit(each, vs)
-                else:
-                    vs.append(each)
-
         # -- find the 3D centroid
-        centroid = [0, 0, 0]
-        total = 0
+        vs = []
         if "geometry" in self.j["CityObjects"][coid]:
             for g in self.j["CityObjects"][coid]["geometry"]:
-                vs = []
-                recusionvisit(g["boundaries"], vs)
-                for each in vs:
-                    v = self.j["vertices"][each]
-                    total += 1
-                    centroid[0] += v[0]
-                    centroid[1] += v[1]
-                    centroid[2] += v[2]
-        if total != 0:
-            centroid[0] /= total
-            centroid[1] /= total
-            centroid[2] /= total
-            if "transform" in self.j:
-                centroid[0] = (centroid[0] * self.j["transform"]["scale"][0]) + self.j[
-                    "transform"
-                ]["translate"][0]
-                centroid[1] = (centroid[1] * self.j["transform"]["scale"][1]) + self.j[
-                    "transform"
-                ]["translate"][1]
-                centroid[2] = (centroid[2] * self.j["transform"]["scale"][2]) + self.j[
-                    "transform"
-                ]["translate"][2]
-            return centroid
-        else:
+                vs.extend(self.j["vertices"][each] for each in flatten(g["boundaries"]))
+        if len(vs) == 0:
             return None
+        centroid = np.add.reduce(np.asarray(vs), axis=0) / len(vs)
+        return self.apply_transform(centroid).tolist()
 
     def get_identifier(self):
         """
@@ -526,34 +627,75 @@ class CityJSON:
 
         return self.get_identifier()
 
-    def get_subset_bbox(self, bbox, exclude=False):
-        re = set()
-        for coid in self.j["CityObjects"]:
-            centroid = self.get_centroid(coid)
-            if (
-                (centroid is not None)
-                and (centroid[0] >= bbox[0])
-                and (centroid[1] >= bbox[1])
-                and (centroid[0] < bbox[2])
-                and (centroid[1] < bbox[3])
-            ):
-                re.add(coid)
-        return self.subset(lsIDs=re, exclude=exclude)
-
-    def get_subset_radius(self, x, y, radius, exclude=False):
-        re = set()
-        for coid in self.j["CityObjects"]:
-            centroid = self.get_centroid(coid)
-            if centroid is not None:
-                dist = ((centroid[0] - x) ** 2) + ((centroid[1] - y) ** 2)
-                if dist < radius**2:
-                    re.add(coid)
-        return self.subset(lsIDs=re, exclude=exclude)
+    def _gather_vertices(self, coids):
+        """Gather the vertices of several CityObjects in one array.
+
+        The vertices of the CityObjects follow each other, and the offset where
+        each one starts is returned, so that per-CityObject values can be
+        computed for all of them with a single ufunc.reduceat().
+        CityObjects without geometry are left out.
+
+        :returns: (ids, vertices, offsets)
+        """
+        ids = []
+        offsets = []
+        idx = []
+        for coid in coids:
+            start = len(idx)
+            for g in self.j["CityObjects"][coid].get("geometry", []):
+                idx.extend(flatten(g["boundaries"]))
+            if len(idx) > start:
+                ids.append(coid)
+                offsets.append(start)
+        if len(ids) == 0:
+            return ids, np.empty((0, 3)), np.empty(0, dtype=np.int64)
+        idx = np.asarray(idx, dtype=np.int64)
+        return ids, np.asarray(self.j["vertices"])[idx], np.asarray(offsets)
+
+    def _all_centroids(self):
+        """Compute the 3D centroid of every CityObject in one pass.
+
+        CityObjects without geometry are left out.
+
+        :returns: (ids, centroids) where centroids is an (N, 3) array
+        """
+        ids, verts, offsets = self._gather_vertices(self.j["CityObjects"])
+        if len(ids) == 0:
+            return np.array(ids), np.empty((0, 3))
+        sums = np.add.reduceat(verts, offsets, axis=0)
+        counts = np.diff(offsets, append=len(verts))
+        centroids = sums / counts[:, np.newaxis]
+        return np.array(ids), self.apply_transform(centroids)
+
+    def get_subset_bbox(self, bbox, exclude=False, inplace=False):
+        ids, c = self._all_centroids()
+        mask = (
+            (c[:, 0] >= bbox[0])
+            & (c[:, 1] >= bbox[1])
+            & (c[:, 0] < bbox[2])
+            & (c[:, 1] < bbox[3])
+        )
+        return self.subset(
+            lsIDs=set(ids[mask].tolist()), exclude=exclude, inplace=inplace
+        )
+
+    def get_subset_radius(self, x, y, radius, exclude=False, inplace=False):
+        ids, c = self._all_centroids()
+        mask = ((c[:, 0] - x) ** 2) + ((c[:, 1] - y) ** 2) < radius**2
+        return self.subset(
+            lsIDs=set(ids[mask].tolist()), exclude=exclude, inplace=inplace
+        )
 
     def is_co_toplevel(self, co):
         return "parents" not in co
 
-    def subset(self, lsIDs, exclude=False):
+    def get_toplevel_ids(self):
+        """Returns the IDs of the 1st-level CityObjects (those without parents)."""
+        return [id for id, co in self.j["CityObjects"].items() if "parents" not in co]
+
+    def subset(self, lsIDs, exclude=False, inplace=False):
+        if inplace:
+            return self.subset_inplace(lsIDs, exclude=exclude)
         # -- copy selected CO to the j2
         re = subset.select_co_ids(self.j, lsIDs)
         # -- exclude
@@ -563,15 +705,16 @@ class CityJSON:
         re = list(re)
         # -- new sliced CityJSON object
         cm2 = CityJSON()
-        cm2.j["version"] = copy.deepcopy(self.j["version"])
-        cm2.path = copy.deepcopy(self.path)
+        cm2.j["version"] = self.j["version"]
+        cm2.path = self.path
         if "extensions" in self.j:
-            cm2.j["extensions"] = copy.deepcopy(self.j["extensions"])
+            cm2.j["extensions"] = json_copy(self.j["extensions"])
         if "transform" in self.j:
-            cm2.j["transform"] = copy.deepcopy(self.j["transform"])
-        # -- select only the COs
-        for each in re:
-            cm2.j["CityObjects"][each] = copy.deepcopy(self.j["CityObjects"][each])
+            cm2.j["transform"] = json_copy(self.j["transform"])
+        # -- select only the COs (copied in one go, their indices are updated below)
+        cm2.j["CityObjects"] = json_copy(
+            {each: self.j["CityObjects"][each] for each in re}
+        )
         # -- geometry
         subset.process_geometry(self.j, cm2.j)
         # -- templates
@@ -583,29 +726,60 @@ class CityJSON:
         # -- copy all other non mandatory properties
         for p in self.j:
             if p not in CITYJSON_PROPERTIES:
-                cm2.j[p] = copy.deepcopy(self.j[p])
+                cm2.j[p] = json_copy(self.j[p])
         # -- metadata
         if "metadata" in self.j:
-            cm2.j["metadata"] = copy.deepcopy(self.j["metadata"])
+            cm2.j["metadata"] = json_copy(self.j["metadata"])
             cm2.update_metadata()
         return cm2
 
-    def get_subset_random(self, number=1, exclude=False):
+    def subset_inplace(self, lsIDs, exclude=False):
+        """Subset this city model, instead of returning a new one like subset().
+
+        Nothing is copied and the CityObjects that are not selected are dropped,
+        thus the city model is never held twice in memory.
+
+        :returns: self
+        """
+        re = subset.select_co_ids(self.j, lsIDs)
+        if exclude:
+            sallkeys = set(self.j["CityObjects"].keys())
+            re = sallkeys - re
+        # -- the process_* functions read the original arrays from j and write
+        # -- the new ones to self.j
+        j = dict(self.j)
+        self.j["CityObjects"] = {
+            each: co for each, co in j["CityObjects"].items() if each in re
+        }
+        # -- geometry
+        subset.process_geometry(j, self.j)
+        # -- templates
+        if "geometry-templates" in j:
+            del self.j["geometry-templates"]
+            subset.process_templates(j, self.j)
+        # -- appearance
+        if "appearance" in j:
+            self.j["appearance"] = {}
+            subset.process_appearance(j, self.j)
+        # -- metadata
+        if "metadata" in self.j:
+            self.update_metadata()
+        return self
+
+    def get_subset_random(self, number=1, exclude=False, inplace=False):
         """Get a random sample of CityObjects without replacement."""
-        top_level_cos = [
-            id for id, co in self.j["CityObjects"].items() if self.is_co_toplevel(co)
-        ]
+        top_level_cos = self.get_toplevel_ids()
         try:
             random_ids = random.sample(top_level_cos, k=number)
         except ValueError:
             # If the sample size 'k' is larger than the number of CityObjects
             random_ids = top_level_cos
-        return self.subset(lsIDs=random_ids, exclude=exclude)
+        return self.subset(lsIDs=random_ids, exclude=exclude, inplace=inplace)
 
-    def get_subset_ids(self, lsIDs, exclude=False):
-        return self.subset(lsIDs=set(lsIDs), exclude=exclude)
+    def get_subset_ids(self, lsIDs, exclude=False, inplace=False):
+        return self.subset(lsIDs=set(lsIDs), exclude=exclude, inplace=inplace)
 
-    def get_subset_cotype(self, cotypes, exclude=False):
+    def get_subset_cotype(self, cotypes, exclude=False, inplace=False):
         # random.seed()
         # total = len(self.j["CityObjects"])
         # if number > total:
@@ -618,12 +792,12 @@ class CityJSON:
         #     if self.is_co_toplevel(self.j["CityObjects"][t]):
         #         re.add(t)
         #         count += 1
-        # return self.subset(lsIDs=re, exclude=exclude)
+        # return self.subset(lsIDs=re, exclude=exclude, inplace=inplace)
         re = set()
-        for theid in self.j["CityObjects"]:
-            if self.j["CityObjects"][theid]["type"] in cotypes:
+        for theid, co in self.j["CityObjects"].items():
+            if co["type"] in cotypes:
                 re.add(theid)
-        return self.subset(lsIDs=re, exclude=exclude)
+        return self.subset(lsIDs=re, exclude=exclude, inplace=inplace)
 
     def get_textures_location(self):
         """Get the location of the texture files
@@ -777,11 +951,7 @@ class CityJSON:
         return True
 
     def number_city_objects_level1(self):
-        total = 0
-        for id in self.j["CityObjects"]:
-            if self.is_co_toplevel(self.j["CityObjects"][id]):
-                total += 1
-        return total
+        return sum(1 for co in self.j["CityObjects"].values() if "parents" not in co)
 
     def get_info(self, long=False):
         s = []
@@ -798,20 +968,21 @@ class CityJSON:
             s.append("Extensions = {}".format(sorted(list(d))))
         # -- hierarchy tree for CityObjects
         s.append("=== CityObjects ===")
-        d = {}
-        for key in self.j["CityObjects"]:
-            ty = self.j["CityObjects"][key]["type"]
-            if "parents" not in self.j["CityObjects"][key]:
-                if ty not in d:
-                    d[ty] = 1
-                else:
-                    d[ty] += 1
-                self.info_children_dfs(key, ty, d)
-        for each in d:
-            if each.count("/") == 0:
-                s2 = "|-- {} ({})".format(each, d[each])
-                s.append(s2)
-                self.print_info_tree(s, d, each, 1)
+        cos = self.j["CityObjects"]
+        toplevel = self.get_toplevel_ids()
+        d_top = Counter(cos[key]["type"] for key in toplevel)
+        d = Counter()
+        for key in toplevel:
+            self.info_children_dfs(key, cos[key]["type"], d)
+        # -- group the "parent/child" type paths by their parent path
+        tree = {}
+        for each, n in d.items():
+            parent, _, name = each.rpartition("/")
+            tree.setdefault(parent, []).append((each, name, n))
+        for each in d_top:
+            s2 = "|-- {} ({})".format(each, d_top[each])
+            s.append(s2)
+            self.print_info_tree(s, tree, each, 1)
         s.append("===================")
         if "appearance" in self.j:
             s.append("materials = {}".format("materials" in self.j["appearance"]))
@@ -830,12 +1001,11 @@ class CityJSON:
         lod = set()
         sem_srf = set()
         co_attributes = set()
-        for key in self.j["CityObjects"]:
-            if "attributes" in self.j["CityObjects"][key]:
-                for attr in self.j["CityObjects"][key]["attributes"].keys():
-                    co_attributes.add(attr)
-            if "geometry" in self.j["CityObjects"][key]:
-                for geom in self.j["CityObjects"][key]["geometry"]:
+        for co in self.j["CityObjects"].values():
+            if "attributes" in co:
+                co_attributes.update(co["attributes"])
+            if "geometry" in co:
+                for geom in co["geometry"]:
                     geoms.add(geom["type"])
                     if "lod" in geom:
                         lod.add(geom["lod"])
@@ -847,8 +1017,9 @@ class CityJSON:
                         )
                     if "semantics" in geom:
                         if geom["semantics"] is not None:
-                            for srf in geom["semantics"]["surfaces"]:
-                                sem_srf.add(srf["type"])
+                            sem_srf.update(
+                                srf["type"] for srf in geom["semantics"]["surfaces"]
+                            )
 
         def getsorted(a):
             return sorted(list(a))
@@ -859,99 +1030,126 @@ class CityJSON:
         s.append("attributes = {}".format(getsorted(co_attributes)))
         return s
 
-    def print_info_tree(self, s, d, t, level):
-        for each in d:
-            if each.startswith(t + "/") and each.count("/") == level:
-                x = each.rsplit("/")[-1]
-                s2 = "{}|-- {} ({})".format(" " * 4 * level, x, d[each])
-                s.append(s2)
-                self.print_info_tree(s, d, each, level + 1)
+    def print_info_tree(self, s, tree, t, level):
+        for each, x, n in tree.get(t, []):
+            s2 = "{}|-- {} ({})".format(" " * 4 * level, x, n)
+            s.append(s2)
+            self.print_info_tree(s, tree, each, level + 1)
 
     def info_children_dfs(self, key, typeparent, d):
-        if "children" in self.j["CityObjects"][key]:
-            for c in self.j["CityObjects"][key]["children"]:
-                ct = self.j["CityObjects"][c]["type"]
-                s = typeparent + "/" + ct
-                if s not in d:
-                    d[s] = 1
-                else:
-                    d[s] += 1
-                self.info_children_dfs(c, s, d)
+        cos = self.j["CityObjects"]
+        for c in cos[key].get("children", []):
+            s = typeparent + "/" + cos[c]["type"]
+            d[s] += 1
+            self.info_children_dfs(c, s, d)
 
     def remove_orphan_vertices(self):
-        def visit_geom(a, oldnewids, newvertices):
-            for i, each in enumerate(a):
-                if isinstance(each, list):
-                    visit_geom(each, oldnewids, newvertices)
-                else:
-                    if each not in oldnewids:
-                        oldnewids[each] = len(newvertices)
-                        newvertices.append(each)
-
-        def update_face(a, oldnewids):
-            for i, each in enumerate(a):
-                if isinstance(each, list):
-                    update_face(each, oldnewids)
-                else:
-                    a[i] = oldnewids[each]
-
-        # --
         totalinput = len(self.j["vertices"])
-        oldnewids = {}
-        newvertices = []
-        # -- visit each geom to gather used ids
-        for theid in self.j["CityObjects"]:
-            if "geometry" in self.j["CityObjects"][theid]:
-                for g in self.j["CityObjects"][theid]["geometry"]:
-                    visit_geom(g["boundaries"], oldnewids, newvertices)
-        # -- update the faces ids
-        for theid in self.j["CityObjects"]:
-            if "geometry" in self.j["CityObjects"][theid]:
-                for g in self.j["CityObjects"][theid]["geometry"]:
-                    update_face(g["boundaries"], oldnewids)
+        lsrings = self._boundary_rings()
+        # -- gather the used ids, in order of first use
+        used = dict.fromkeys(chain.from_iterable(lsrings))
+        oldnewids = {each: i for i, each in enumerate(used)}
+        # -- update the faces ids, one ring at a time
+        for r in lsrings:
+            r[:] = map(oldnewids.__getitem__, r)
         # -- replace the vertices, innit?
-        newv2 = []
-        for v in newvertices:
-            newv2.append(self.j["vertices"][v])
-        self.j["vertices"] = newv2
+        vertices = self.j["vertices"]
+        self.j["vertices"] = list(map(vertices.__getitem__, oldnewids))
         return totalinput - len(self.j["vertices"])
 
-    def remove_duplicate_vertices(self):
-        def update_geom_indices(a, newids):
-            for i, each in enumerate(a):
-                if isinstance(each, list):
-                    update_geom_indices(each, newids)
-                else:
-                    a[i] = newids[each]
+    def _unique_vertex_ids(self):
+        """Find the duplicate vertices.
 
-        # --
+        :returns: ``None`` if there are none, otherwise ``(verts, newids, keep)``: the
+            vertices as an array, the new id of each vertex, and the vertex kept for
+            each new id (the new ids follow the order of first occurrence)
+        """
         totalinput = len(self.j["vertices"])
-        h = {}
-        newids = [-1] * len(self.j["vertices"])
-        newvertices = []
-        for i, v in enumerate(self.j["vertices"]):
-            s = "{x} {y} {z}".format(x=v[0], y=v[1], z=v[2])
-            if s not in h:
-                newid = len(h)
-                newids[i] = newid
-                h[s] = newid
-                newvertices.append(s)
-            else:
-                newids[i] = h[s]
+        if totalinput == 0:
+            return None
+        # -- with a transform the vertices are integers and the comparison is exact
+        if "transform" in self.j:
+            verts = np.asarray(self.j["vertices"])
+            if verts.dtype.kind == "f":
+                # -- casting would truncate them, eg 1.7 and 1 would be merged
+                if not np.array_equal(verts, np.rint(verts)):
+                    raise ValueError(
+                        "The vertices of a file with a transform must be integers"
+                    )
+                verts = verts.astype(np.int64)
+        else:
+            verts = np.asarray(self.j["vertices"], dtype=np.float64)
+        keys = verts
+        if verts.dtype.kind == "i":
+            # -- pack each x/y/z into a single int64 key (exact, no collisions)
+            # -- when the extent allows it, sorting 1D keys is much faster than rows
+            vmin = verts.min(axis=0)
+            ext = [b - a + 1 for a, b in zip(vmin.tolist(), verts.max(axis=0).tolist())]
+            if ext[0] * ext[1] * ext[2] < 2**63:
+                d = verts - vmin
+                keys = (d[:, 0] * ext[1] + d[:, 1]) * ext[2] + d[:, 2]
+        if keys.ndim == 1:
+            _, first, inv = np.unique(keys, return_index=True, return_inverse=True)
+        else:
+            _, first, inv = np.unique(
+                keys, axis=0, return_index=True, return_inverse=True
+            )
+        if len(first) == totalinput:
+            return None
+        # -- np.unique sorts the vertices, keep them in order of first occurrence
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return (verts, rank[inv.reshape(-1)], first[order])
+
+    def _boundary_rings(self):
+        return [
+            r
+            for co in self.j["CityObjects"].values()
+            for g in co.get("geometry", [])
+            for r in rings(g["boundaries"])
+        ]
+
+    def remove_duplicate_vertices(self):
+        totalinput = len(self.j["vertices"])
+        dup = self._unique_vertex_ids()
+        # -- nothing to merge, the boundaries and vertices stay as they are
+        if dup is None:
+            return 0
+        verts, newids, keep = dup
         # -- update indices
-        for theid in self.j["CityObjects"]:
-            if "geometry" in self.j["CityObjects"][theid]:
-                for g in self.j["CityObjects"][theid]["geometry"]:
-                    update_geom_indices(g["boundaries"], newids)
+        newids = newids.tolist()
+        for r in self._boundary_rings():
+            r[:] = map(newids.__getitem__, r)
         # -- replace the vertices, innit?
-        newv2 = []
-        for v in newvertices:
-            if "transform" in self.j:
-                a = list(map(int, v.split()))
-            else:
-                a = list(map(float, v.split()))
-            newv2.append(a)
-        self.j["vertices"] = newv2
+        self.j["vertices"] = verts[keep].tolist()
+        return totalinput - len(self.j["vertices"])
+
+    def _remap_and_compact_vertices(self):
+        """Remove the duplicate and the orphan vertices.
+
+        Same result as :py:meth:`remove_duplicate_vertices` followed by
+        :py:meth:`remove_orphan_vertices`, but the boundaries are rewritten once.
+
+        :returns: the number of vertices removed
+        """
+        totalinput = len(self.j["vertices"])
+        dup = self._unique_vertex_ids()
+        if dup is None:
+            return self.remove_orphan_vertices()
+        verts, newids, keep = dup
+        lsrings = self._boundary_rings()
+        flat = newids[np.fromiter(chain.from_iterable(lsrings), dtype=np.int64)]
+        # -- the (deduplicated) ids used, in order of first use
+        used, first = np.unique(flat, return_index=True)
+        used = used[np.argsort(first)]
+        finalids = np.empty(len(keep), dtype=np.int64)
+        finalids[used] = np.arange(len(used))
+        # -- update the faces ids
+        newflat = iter(finalids[flat].tolist())
+        for r in lsrings:
+            r[:] = islice(newflat, len(r))
+        self.j["vertices"] = verts[keep[used]].tolist()
         return totalinput - len(self.j["vertices"])
 
     def compress(self, important_digits=3, translate=None):
@@ -964,23 +1162,26 @@ class CityJSON:
         """
         if "transform" in self.j:
             return False
+        v = np.asarray(self.j["vertices"], dtype=np.float64).reshape(-1, 3)
         # -- find the minx/miny/minz or set from translate
         if translate:
-            bbox = translate
+            bbox = list(translate)
+        elif len(v) > 0:
+            bbox = v.min(axis=0).tolist()
         else:
             bbox = [9e9, 9e9, 9e9]
-            for v in self.j["vertices"]:
-                for i in range(3):
-                    if v[i] < bbox[i]:
-                        bbox[i] = v[i]
         # convert vertices in self.j to int
-        n = [0, 0, 0]
+        n = v - bbox
+        s = n * (10**important_digits)
+        q = np.rint(s)
+        # -- near a .5 tie the product can round the other way, those few are
+        # -- rounded from the exact value like the "%.3f" formatting does
         p = "%." + str(important_digits) + "f"
-        for v in self.j["vertices"]:
-            for i in range(3):
-                n[i] = v[i] - bbox[i]
-            for i in range(3):
-                v[i] = int((p % n[i]).replace(".", ""))
+        for i in np.flatnonzero(
+            np.abs(np.abs(s - q) - 0.5) <= 2 * np.spacing(np.abs(s))
+        ):
+            q.flat[i] = int((p % n.flat[i]).replace(".", ""))
+        self.j["vertices"] = q.astype(np.int64).tolist()
 
         # put transform
         ss = 1.0 / (math.pow(10, important_digits))
@@ -989,22 +1190,13 @@ class CityJSON:
         self.j["transform"]["scale"] = [ss, ss, ss]
         self.j["transform"]["translate"] = [bbox[0], bbox[1], bbox[2]]
         # -- clean the file
-        _ = self.remove_duplicate_vertices()
-        _ = self.remove_orphan_vertices()
+        _ = self._remap_and_compact_vertices()
         return True
 
     def decompress(self):
         if "transform" in self.j:
-            for v in self.j["vertices"]:
-                v[0] = (v[0] * self.j["transform"]["scale"][0]) + self.j["transform"][
-                    "translate"
-                ][0]
-                v[1] = (v[1] * self.j["transform"]["scale"][1]) + self.j["transform"][
-                    "translate"
-                ][1]
-                v[2] = (v[2] * self.j["transform"]["scale"][2]) + self.j["transform"][
-                    "translate"
-                ][2]
+            v = np.asarray(self.j["vertices"], dtype=np.float64).reshape(-1, 3)
+            self.j["vertices"] = self.apply_transform(v).tolist()
             del self.j["transform"]
             return True
         else:
@@ -1012,72 +1204,56 @@ class CityJSON:
 
     def add_cityjsonfeature(self, j):
         offset = len(self.j["vertices"])
-        self.j["vertices"] += j["vertices"]
-        # -- add each CityObjects
-        for theid in j["CityObjects"]:
-            self.j["CityObjects"][theid] = j["CityObjects"][theid]
-            if "geometry" in self.j["CityObjects"][theid]:
-                for g in self.j["CityObjects"][theid]["geometry"]:
+        self.j["vertices"].extend(j["vertices"])
+        # -- add each CityObjects, and keep their geometries for the updates below
+        cos = self.j["CityObjects"]
+        geoms = []
+        for theid, co in j["CityObjects"].items():
+            cos[theid] = co
+            if "geometry" in co:
+                for g in co["geometry"]:
                     update_geom_indices(g["boundaries"], offset)
-
+                    geoms.append((theid, g))
+        if "appearance" not in j:
+            return
+        app = j["appearance"]
         # -- materials
-        if ("appearance" in j) and ("materials" in j["appearance"]):
-            if ("appearance" in self.j) and ("materials" in self.j["appearance"]):
-                offset = len(self.j["appearance"]["materials"])
-            else:
-                if "appearance" not in self.j:
-                    self.j["appearance"] = {}
-                if "materials" not in self.j["appearance"]:
-                    self.j["appearance"]["materials"] = []
-                offset = 0
+        if "materials" in app:
+            materials = self.j.setdefault("appearance", {}).setdefault("materials", [])
+            offset = len(materials)
             # -- copy materials
-            for m in j["appearance"]["materials"]:
-                self.j["appearance"]["materials"].append(m)
+            materials.extend(app["materials"])
             # -- update the "material" in each Geometry
-            for theid in j["CityObjects"]:
-                for g in self.j["CityObjects"][theid].get("geometry", []):
-                    if "material" in g:
-                        for m in g["material"]:
-                            if "values" in g["material"][m]:
-                                update_geom_indices(g["material"][m]["values"], offset)
-                            else:
-                                g["material"][m]["value"] = (
-                                    g["material"][m]["value"] + offset
-                                )
+            for theid, g in geoms:
+                if "material" in g:
+                    for m in g["material"].values():
+                        if "values" in m:
+                            update_geom_indices(m["values"], offset)
+                        else:
+                            m["value"] = m["value"] + offset
         # -- textures
-        if ("appearance" in j) and ("textures" in j["appearance"]):
-            if ("appearance" in self.j) and ("textures" in self.j["appearance"]):
-                toffset = len(self.j["appearance"]["textures"])
-                voffset = len(self.j["appearance"]["vertices-texture"])
-            else:
-                if "appearance" not in self.j:
-                    self.j["appearance"] = {}
-                if "textures" not in self.j["appearance"]:
-                    self.j["appearance"]["textures"] = []
-                if "vertices-texture" not in self.j["appearance"]:
-                    self.j["appearance"]["vertices-texture"] = []
-                toffset = 0
-                voffset = 0
+        if "textures" in app:
+            appearance = self.j.setdefault("appearance", {})
+            textures = appearance.setdefault("textures", [])
+            vertices_texture = appearance.setdefault("vertices-texture", [])
+            toffset = len(textures)
+            voffset = len(vertices_texture)
             # -- copy vertices-texture
-            self.j["appearance"]["vertices-texture"] += j["appearance"][
-                "vertices-texture"
-            ]
+            vertices_texture.extend(app["vertices-texture"])
             # -- copy textures
-            for t in j["appearance"]["textures"]:
-                self.j["appearance"]["textures"].append(t)
+            textures.extend(app["textures"])
             # -- update the "texture" in each Geometry
-            for theid in j["CityObjects"]:
-                for g in self.j["CityObjects"][theid]["geometry"]:
-                    if "texture" in g:
-                        for m in g["texture"]:
-                            if "values" in g["texture"][m]:
-                                update_texture_indices(
-                                    g["texture"][m]["values"], toffset, voffset
-                                )
-                            else:
-                                raise KeyError(
-                                    f"The member 'values' is missing from the texture '{m}' in CityObject {theid}"
-                                )
+            for theid, g in geoms:
+                if "texture" in g:
+                    for m in g["texture"]:
+                        if "values" in g["texture"][m]:
+                            update_texture_indices(
+                                g["texture"][m]["values"], toffset, voffset
+                            )
+                        else:
+                            raise KeyError(
+                                f"The member 'values' is missing from the texture '{m}' in CityObject {theid}"
+                            )
 
         # self.remove_duplicate_vertices()
         # self.remove_orphan_vertices()
@@ -1092,50 +1268,48 @@ class CityJSON:
         # updates materials
         #############################
 
+        # -- with the same transform everywhere the integer vertices can be
+        # -- concatenated as they are, no need to decompress/compress
+        sametransform = all(cm.j["transform"] == self.j["transform"] for cm in lsCMs)
         # -- decompress current CM
         imp_digits = math.ceil(abs(math.log(self.j["transform"]["scale"][0], 10)))
-        self.decompress()
+        if not sametransform:
+            self.decompress()
 
         for cm in lsCMs:
             # -- decompress
-            if math.ceil(abs(math.log(cm.j["transform"]["scale"][0], 10))) > imp_digits:
-                imp_digits = math.ceil(abs(math.log(cm.j["transform"]["scale"][0], 10)))
-            cm.decompress()
+            d = math.ceil(abs(math.log(cm.j["transform"]["scale"][0], 10)))
+            imp_digits = max(imp_digits, d)
+            if not sametransform:
+                cm.decompress()
             offset = len(self.j["vertices"])
             self.j["vertices"] += cm.j["vertices"]
             # -- add each CityObjects
-            for theid in cm.j["CityObjects"]:
-                if theid in self.j["CityObjects"]:
+            cos = self.j["CityObjects"]
+            for theid, co2 in cm.j["CityObjects"].items():
+                co = cos.get(theid)
+                if co is not None:
                     # -- merge attributes if not present (based on the property name only)
-                    if "attributes" in cm.j["CityObjects"][theid]:
-                        for a in cm.j["CityObjects"][theid]["attributes"]:
-                            if a not in self.j["CityObjects"][theid]["attributes"]:
-                                self.j["CityObjects"][theid]["attributes"][a] = cm.j[
-                                    "CityObjects"
-                                ][theid]["attributes"][a]
+                    if "attributes" in co2:
+                        attributes = co["attributes"]
+                        for a, value in co2["attributes"].items():
+                            if a not in attributes:
+                                attributes[a] = value
                     # -- merge geoms if not present (based on LoD only)
-                    if "geometry" in self.j["CityObjects"][theid]:
-                        for g in cm.j["CityObjects"][theid]["geometry"]:
+                    if "geometry" in co:
+                        geoms = co["geometry"]
+                        lods = {str(g2["lod"]) for g2 in geoms}
+                        for g in co2["geometry"]:
                             thelod = str(g["lod"])
-                            b = False
-                            for g2 in self.j["CityObjects"][theid]["geometry"]:
-                                if g2["lod"] == thelod:
-                                    b = True
-                                    break
-                            if not b:
-                                self.j["CityObjects"][theid]["geometry"].append(g)
-                                update_geom_indices(
-                                    self.j["CityObjects"][theid]["geometry"][-1][
-                                        "boundaries"
-                                    ],
-                                    offset,
-                                )
+                            if thelod not in lods:
+                                geoms.append(g)
+                                lods.add(thelod)
+                                update_geom_indices(g["boundaries"], offset)
                 else:
                     # -- copy the CO
-                    self.j["CityObjects"][theid] = cm.j["CityObjects"][theid]
-                    if "geometry" in self.j["CityObjects"][theid]:
-                        for g in self.j["CityObjects"][theid]["geometry"]:
-                            update_geom_indices(g["boundaries"], offset)
+                    cos[theid] = co2
+                    for g in co2.get("geometry", []):
+                        update_geom_indices(g["boundaries"], offset)
             # -- templates
             if "geometry-templates" in cm.j:
                 if "geometry-templates" in self.j:
@@ -1160,10 +1334,9 @@ class CityJSON:
                 ]["vertices-templates"]
                 # -- update the "template" in each GeometryInstance
                 for theid in cm.j["CityObjects"]:
-                    if "geometry" in self.j["CityObjects"][theid]:
-                        for g in self.j["CityObjects"][theid]["geometry"]:
-                            if g["type"] == "GeometryInstance":
-                                g["template"] += notemplates
+                    for g in cos[theid].get("geometry", []):
+                        if g["type"] == "GeometryInstance":
+                            g["template"] += notemplates
             # -- materials
             if ("appearance" in cm.j) and ("materials" in cm.j["appearance"]):
                 if ("appearance" in self.j) and ("materials" in self.j["appearance"]):
@@ -1179,7 +1352,7 @@ class CityJSON:
                     self.j["appearance"]["materials"].append(m)
                 # -- update the "material" in each Geometry
                 for theid in cm.j["CityObjects"]:
-                    for g in self.j["CityObjects"][theid].get("geometry", []):
+                    for g in cos[theid].get("geometry", []):
                         if "material" in g:
                             for m in g["material"]:
                                 if "values" in g["material"][m]:
@@ -1213,7 +1386,7 @@ class CityJSON:
                     self.j["appearance"]["textures"].append(t)
                 # -- update the "texture" in each Geometry
                 for theid in cm.j["CityObjects"]:
-                    for g in self.j["CityObjects"][theid].get("geometry", []):
+                    for g in cos[theid].get("geometry", []):
                         if "texture" in g:
                             for m in g["texture"]:
                                 if "values" in g["texture"][m]:
@@ -1225,10 +1398,10 @@ class CityJSON:
                                         f"The member 'values' is missing from the texture '{m}' in CityObject {theid}"
                                     )
 
-        self.remove_duplicate_vertices()
-        self.remove_orphan_vertices()
+        self._remap_and_compact_vertices()
         self.update_bbox()
-        self.compress(imp_digits)
+        if not sametransform:
+            self.compress(imp_digits)
         return True
 
     def upgrade_version_v06_v08(self):
@@ -1243,44 +1416,34 @@ class CityJSON:
             self.set_epsg(epsg)
         # -- bbox
         self.update_bbox()
-        for id in self.j["CityObjects"]:
-            if "bbox" in self.j["CityObjects"][id]:
-                self.j["CityObjects"][id]["geographicalExtent"] = self.j["CityObjects"][
-                    id
-                ]["bbox"]
-                del self.j["CityObjects"][id]["bbox"]
+        cos = self.j["CityObjects"]
+        for co in cos.values():
+            if "bbox" in co:
+                co["geographicalExtent"] = co["bbox"]
+                del co["bbox"]
         # #-- parent-children: do children have the parent too?
         subs = ["Parts", "Installations", "ConstructionElements"]
-        for id in self.j["CityObjects"]:
+        for id, co in cos.items():
+            # -- move the Parts/Installations to the children
             children = []
             for sub in subs:
-                if sub in self.j["CityObjects"][id]:
-                    for each in self.j["CityObjects"][id][sub]:
-                        children.append(each)
+                if sub in co:
+                    children.extend(co.pop(sub))
             if len(children) > 0:
-                # -- remove the Parts/Installations
-                self.j["CityObjects"][id]["children"] = children
-                for sub in subs:
-                    if sub in self.j["CityObjects"][id]:
-                        del self.j["CityObjects"][id][sub]
+                co["children"] = children
                 # -- put the "parent" in each children
                 for child in children:
-                    if child in self.j["CityObjects"]:
-                        self.j["CityObjects"][child]["parent"] = id
+                    if child in cos:
+                        cos[child]["parent"] = id
 
     def upgrade_version_v08_v09(self, reasons):
         # -- version
         self.j["version"] = "0.9"
         # -- parent --> parents[]
-        allids = []
-        for id in self.j["CityObjects"]:
-            allids.append(id)
-        for id in allids:
-            if "parent" in self.j["CityObjects"][id]:
-                self.j["CityObjects"][id]["parents"] = [
-                    self.j["CityObjects"][id]["parent"]
-                ]
-                del self.j["CityObjects"][id]["parent"]
+        for co in self.j["CityObjects"].values():
+            if "parent" in co:
+                co["parents"] = [co["parent"]]
+                del co["parent"]
         # -- extensions
         if "extensions" in self.j:
             reasons += (
@@ -1304,46 +1467,10 @@ class CityJSON:
         self.j["version"] = "1.1"
         # -- compress for "transform"
         self.compress(digit)
-        # -- lod=string
-        for theid in self.j["CityObjects"]:
-            if "geometry" in self.j["CityObjects"][theid]:
-                for each, geom in enumerate(self.j["CityObjects"][theid]["geometry"]):
-                    if (
-                        self.j["CityObjects"][theid]["geometry"][each]["type"]
-                        != "GeometryInstance"
-                    ):
-                        self.j["CityObjects"][theid]["geometry"][each]["lod"] = str(
-                            self.j["CityObjects"][theid]["geometry"][each]["lod"]
-                        )
+        # -- lod=string (templates), the CityObjects are done below
         if "geometry-templates" in self.j:
-            for i, g in enumerate(self.j["geometry-templates"]["templates"]):
-                self.j["geometry-templates"]["templates"][i]["lod"] = str(
-                    self.j["geometry-templates"]["templates"][i]["lod"]
-                )
-        # -- CityObjectGroup
-        # members -> children
-        # add parents to children
-        for theid in self.j["CityObjects"]:
-            if self.j["CityObjects"][theid]["type"] == "CityObjectGroup":
-                self.j["CityObjects"][theid]["children"] = self.j["CityObjects"][theid][
-                    "members"
-                ]
-                del self.j["CityObjects"][theid]["members"]
-                for ch in self.j["CityObjects"][theid]["children"]:
-                    if "parents" not in self.j["CityObjects"][ch]:
-                        self.j["CityObjects"][ch]["parents"] = []
-                    if theid not in self.j["CityObjects"][ch]["parents"]:
-                        self.j["CityObjects"][ch]["parents"].append(theid)
-        # -- empty geometries
-        for theid in self.j["CityObjects"]:
-            if ("geometry" in self.j["CityObjects"][theid]) and (
-                len(self.j["CityObjects"][theid]["geometry"]) == 0
-            ):
-                del self.j["CityObjects"][theid]["geometry"]
-        # -- BridgeConstructionElement -> BridgeConstructiveElement
-        for theid in self.j["CityObjects"]:
-            if self.j["CityObjects"][theid]["type"] == "BridgeConstructionElement":
-                self.j["CityObjects"][theid]["type"] = "BridgeConstructiveElement"
+            for g in self.j["geometry-templates"]["templates"]:
+                g["lod"] = str(g["lod"])
         # -- CRS: use the new OGC scheme
         if "metadata" in self.j and "referenceSystem" in self.j["metadata"]:
             s = self.j["metadata"]["referenceSystem"]
@@ -1352,12 +1479,37 @@ class CityJSON:
                     "https://www.opengis.net/def/crs/EPSG/0/%d"
                     % int(s[s.find("::") + 2 :])
                 )
-        # -- addresses are now arrays TODO
-        for theid in self.j["CityObjects"]:
-            if "address" in self.j["CityObjects"][theid]:
-                self.j["CityObjects"][theid]["address"] = [
-                    self.j["CityObjects"][theid]["address"]
-                ]
+        # -- all the changes to the CityObjects, in one pass
+        gco = False
+        cos = self.j["CityObjects"]
+        for theid, co in cos.items():
+            # -- lod=string
+            for geom in co.get("geometry", []):
+                if geom["type"] != "GeometryInstance":
+                    geom["lod"] = str(geom["lod"])
+            # -- CityObjectGroup
+            # members -> children
+            # add parents to children
+            if co["type"] == "CityObjectGroup":
+                co["children"] = co["members"]
+                del co["members"]
+                for ch in co["children"]:
+                    parents = cos[ch].setdefault("parents", [])
+                    if theid not in parents:
+                        parents.append(theid)
+            # -- empty geometries
+            if ("geometry" in co) and (len(co["geometry"]) == 0):
+                del co["geometry"]
+            # -- BridgeConstructionElement -> BridgeConstructiveElement
+            if co["type"] == "BridgeConstructionElement":
+                co["type"] = "BridgeConstructiveElement"
+            # -- addresses are now arrays TODO
+            if "address" in co:
+                co["address"] = [co["address"]]
+            # -- GenericCityObject is no longer, it becomes an Extension
+            if co["type"] == "GenericCityObject":
+                co["type"] = "+GenericCityObject"
+                gco = True
         # -- metadata calculate
         if "metadata" in self.j:
             v11_properties = {
@@ -1381,11 +1533,6 @@ class CityJSON:
                     self.j["metadata"].pop(each)
                     self.j["metadata"][v11_properties[each]] = tmp
         # -- GenericCityObject is no longer, add the Extension GenericCityObject
-        gco = False
-        for theid in self.j["CityObjects"]:
-            if self.j["CityObjects"][theid]["type"] == "GenericCityObject":
-                self.j["CityObjects"][theid]["type"] = "+GenericCityObject"
-                gco = True
         if gco:
             reasons = (
                 '"GenericCityObject" is no longer in v1.1, instead Extensions are used.'
@@ -1427,9 +1574,9 @@ class CityJSON:
             )
         ):
             # -- remove the +
-            for theid in self.j["CityObjects"]:
-                if self.j["CityObjects"][theid]["type"] == "+GenericCityObject":
-                    self.j["CityObjects"][theid]["type"] = "GenericCityObject"
+            for co in self.j["CityObjects"].values():
+                if co["type"] == "+GenericCityObject":
+                    co["type"] = "GenericCityObject"
             # -- delete the Generic extension
             del self.j["extensions"]["Generic"]
             # -- explain to user
@@ -1444,7 +1591,7 @@ class CityJSON:
     def upgrade_version(self, newversion, digit):
         re = True
         reasons = ""
-        if CITYJSON_VERSIONS_SUPPORTED.count(newversion) == 0:
+        if newversion not in _CITYJSON_VERSIONS_SET:
             return (False, "This version is not supported")
         # -- from v0.6
         if self.get_version() == CITYJSON_VERSIONS_SUPPORTED[0]:
@@ -1473,12 +1620,28 @@ class CityJSON:
         glb = convert.to_glb(self, do_triangulate=do_triangulate)
         return glb
 
-    def export2jsonl(self):
-        out = StringIO()
-        out.write(self.cityjson_for_features() + "\n")
+    def export2jsonl(self, out=None):
+        """Export the city model as CityJSONFeatures, one per line (JSON Lines).
+
+        :param out: text or binary file-like object the lines are written to as
+            they are generated, a new StringIO if None
+        :returns: ``out``
+        """
+        if out is None:
+            out = StringIO()
+        if isinstance(out, (RawIOBase, BufferedIOBase)):
+            dump, newline = _dumpb_compact, b"\n"
+            out.write(self.cityjson_for_features().encode("utf-8"))
+        else:
+            dump, newline = _dumps_compact, "\n"
+            out.write(self.cityjson_for_features())
+        out.write(newline)
         # -- take each IDs and create on CityJSONFeature
+        # -- (the features share the transform, their vertices are integers
+        # -- and there is nothing to round)
         for feature in self.generate_features():
-            out.write(json.dumps(feature.j, separators=(",", ":")) + "\n")
+            out.write(dump(feature.j))
+            out.write(newline)
         return out
 
     def cityjson_for_features(self):
@@ -1487,7 +1650,7 @@ class CityJSON:
         CityJSONFeature stream, thus the 'vertices' and 'CityObjects' are empty."""
         j2 = {}
         j2["type"] = "CityJSON"
-        j2["version"] = CITYJSON_VERSIONS_SUPPORTED[-1]
+        j2["version"] = CITYJSON_VERSION_LATEST
         j2["CityObjects"] = {}
         j2["vertices"] = []
         j2["transform"] = self.j["transform"]
@@ -1497,7 +1660,7 @@ class CityJSON:
             j2["geometry-templates"] = self.j["geometry-templates"]
         if "extensions" in self.j:
             j2["extensions"] = self.j["extensions"]
-        return json.dumps(j2, separators=(",", ":"))
+        return dumps(j2)
 
     def generate_features(self):
         """Generates CityJSONFeatures from the city model.
@@ -1512,10 +1675,8 @@ class CityJSON:
         """
         idsdone = set()
         theallowedproperties = ["type", "id", "CityObjects", "vertices", "appearance"]
-        for theid in self.j["CityObjects"]:
-            if ("parents" not in self.j["CityObjects"][theid]) and (
-                theid not in idsdone
-            ):
+        for theid, co in self.j["CityObjects"].items():
+            if ("parents" not in co) and (theid not in idsdone):
                 cm2 = self.get_subset_ids([theid])
                 cm2.j["type"] = "CityJSONFeature"
                 cm2.j["id"] = theid
@@ -1527,19 +1688,26 @@ class CityJSON:
                 for p in todelete:
                     del cm2.j[p]
                 yield cm2
-                for theid2 in cm2.j["CityObjects"]:
-                    idsdone.add(theid)
+                # -- the children are in the feature too, never output them again
+                idsdone.update(cm2.j["CityObjects"])
 
-    def export2obj(self, sloppy, mtl_fname=None):
+    def export2obj(self, sloppy, mtl_fname=None, out=None):
         """Exports the city model to a Wavefront OBJ file. If the model has textures and `mtl_fname` is not None, a MTL
         file is also created. The obj file will refer to the .mtl file by the name `mtl_fname`.
 
         Both the `.obj` and the optional `.mtl` files are returned as StringIO objects.
+        If `out` (a text file-like object) is given, the `.obj` is written to it as it
+        is generated, and `out` is returned instead.
         """
         imp_digits = math.ceil(abs(math.log(self.j["transform"]["scale"][0], 10)))
         ids = "." + str(imp_digits) + "f"
-        self.decompress()
-        out = StringIO()
+        # -- the real-world coordinates are only computed as an array, the model
+        # -- itself is not decompressed (and compressed again)
+        vnp = self.apply_transform(
+            np.asarray(self.j["vertices"], dtype=np.float64).reshape(-1, 3)
+        )
+        if out is None:
+            out = StringIO()
         # -- handle textures
         out_mtl = None
         has_textures = "appearance" in self.j and "textures" in self.j["appearance"]
@@ -1563,25 +1731,13 @@ class CityJSON:
                 out_mtl.write("map_Kd {}\n".format(t["image"]))
                 out_mtl.write("\n")
         # -- write vertices
-        for v in self.j["vertices"]:
-            s = format(
-                "v {} {} {}\n".format(
-                    format(v[0], ids), format(v[1], ids), format(v[2], ids)
-                )
-            )
-            out.write(s)
-        vnp = np.array(self.j["vertices"])
+        fmt = f"v %{ids} %{ids} %{ids}\n"
+        chunk = 100_000
+        for i in range(0, len(vnp), chunk):
+            out.write("".join([fmt % tuple(v) for v in vnp[i : i + chunk].tolist()]))
         # -- translate to minx,miny
-        minx = 9e9
-        miny = 9e9
-        for each in vnp:
-            if each[0] < minx:
-                minx = each[0]
-            if each[1] < miny:
-                miny = each[1]
-        for each in vnp:
-            each[0] -= minx
-            each[1] -= miny
+        if len(vnp) > 0:
+            vnp[:, :2] -= vnp[:, :2].min(axis=0)
 
         # -- write texture vertices
         if (
@@ -1589,19 +1745,21 @@ class CityJSON:
             and "appearance" in self.j
             and "vertices-texture" in self.j["appearance"]
         ):
-            for v in self.j["appearance"]["vertices-texture"]:
-                s = format("vt {} {}\n".format(format(v[0], ids), format(v[1], ids)))
-                out.write(s)
+            fmt = f"vt %{ids} %{ids}\n"
+            out.write(
+                "".join(
+                    [fmt % tuple(v) for v in self.j["appearance"]["vertices-texture"]]
+                )
+            )
         # -- start with the CO
-        for theid in self.j["CityObjects"]:
-            if "geometry" not in self.j["CityObjects"][theid]:
+        for theid, co in self.j["CityObjects"].items():
+            if "geometry" not in co:
                 continue
-            for geom in self.j["CityObjects"][theid]["geometry"]:
+            for geom in co["geometry"]:
                 out.write("o " + str(theid) + "\n")
                 if export_textures and "texture" in geom and len(geom["texture"]) > 0:
-                    theme = list(geom["texture"].keys())[
-                        0
-                    ]  # Use the first theme in the dict
+                    # -- use the first theme in the dict
+                    theme = next(iter(geom["texture"]))
                     texture_values = geom["texture"][theme]["values"]
                     if (geom["type"] == "MultiSurface") or (
                         geom["type"] == "CompositeSurface"
@@ -1628,105 +1786,63 @@ class CityJSON:
                         for shell in geom["boundaries"]:
                             convert.faces_to_obj(shell, out, sloppy, vnp)
 
-        self.compress(imp_digits)
         if export_textures:
             return out, out_mtl
         return out
 
-    def export2stl(self, sloppy):
+    def export2stl(self, sloppy, out=None):
+        """Exports the city model to an ASCII STL file.
+
+        :param out: text file-like object the facets are written to as they are
+            generated, a new StringIO if None
+        :returns: ``out``
+        """
         # TODO: refectoring, duplicated code from 2obj()
-        out = StringIO()
+        if out is None:
+            out = StringIO()
         out.write("solid\n")
 
         # -- translate to minx,miny
-        vnp = np.array(self.j["vertices"])
-        minx = 9e9
-        miny = 9e9
-        for each in vnp:
-            if each[0] < minx:
-                minx = each[0]
-            if each[1] < miny:
-                miny = each[1]
-        for each in vnp:
-            each[0] -= minx
-            each[1] -= miny
+        vnp = np.asarray(self.j["vertices"], dtype=np.float64).reshape(-1, 3)
+        if len(vnp) > 0:
+            vnp[:, :2] -= vnp[:, :2].min(axis=0)
+
+        # -- the 'vertex' lines are formatted once, and not for each facet
+        vlines = ["vertex %s %s %s\n" % tuple(v) for v in self.j["vertices"]]
+
+        def write_facets(face):
+            re, b = geom_help.triangulate_face(face, vnp, sloppy)
+            if b:
+                re = re.tolist()
+            # -- the normal of the face, from the points of its outer ring
+            n, bb = geom_help.get_normal_newell(vnp[face[0]])
+            if b:
+                head = "facet normal %f %f %f\nouter loop\n" % (n[0], n[1], n[2])
+                out.write(
+                    "".join(
+                        [
+                            head
+                            + vlines[t[0]]
+                            + vlines[t[1]]
+                            + vlines[t[2]]
+                            + "endloop\nendfacet\n"
+                            for t in re
+                        ]
+                    )
+                )
 
         # -- start with the CO
-        for theid in self.j["CityObjects"]:
-            for geom in self.j["CityObjects"][theid]["geometry"]:
+        for co in self.j["CityObjects"].values():
+            for geom in co["geometry"]:
                 if (geom["type"] == "MultiSurface") or (
                     geom["type"] == "CompositeSurface"
                 ):
                     for face in geom["boundaries"]:
-                        re, b = geom_help.triangulate_face(face, vnp, sloppy)
-                        n, bb = geom_help.get_normal_newell(face)
-                        if b:
-                            for t in re:
-                                out.write(
-                                    "facet normal %f %f %f\nouter loop\n"
-                                    % (n[0], n[1], n[2])
-                                )
-                                out.write(
-                                    "vertex %s %s %s\n"
-                                    % (
-                                        str(self.j["vertices"][t[0]][0]),
-                                        str(self.j["vertices"][t[0]][1]),
-                                        str(self.j["vertices"][t[0]][2]),
-                                    )
-                                )
-                                out.write(
-                                    "vertex %s %s %s\n"
-                                    % (
-                                        str(self.j["vertices"][t[1]][0]),
-                                        str(self.j["vertices"][t[1]][1]),
-                                        str(self.j["vertices"][t[1]][2]),
-                                    )
-                                )
-                                out.write(
-                                    "vertex %s %s %s\n"
-                                    % (
-                                        str(self.j["vertices"][t[2]][0]),
-                                        str(self.j["vertices"][t[2]][1]),
-                                        str(self.j["vertices"][t[2]][2]),
-                                    )
-                                )
-                                out.write("endloop\nendfacet\n")
+                        write_facets(face)
                 elif geom["type"] == "Solid":
                     for shell in geom["boundaries"]:
-                        for i, face in enumerate(shell):
-                            re, b = geom_help.triangulate_face(face, vnp, sloppy)
-                            n, bb = geom_help.get_normal_newell(face)
-                            if b:
-                                for t in re:
-                                    out.write(
-                                        "facet normal %f %f %f\nouter loop\n"
-                                        % (n[0], n[1], n[2])
-                                    )
-                                    out.write(
-                                        "vertex %s %s %s\n"
-                                        % (
-                                            str(self.j["vertices"][t[0]][0]),
-                                            str(self.j["vertices"][t[0]][1]),
-                                            str(self.j["vertices"][t[0]][2]),
-                                        )
-                                    )
-                                    out.write(
-                                        "vertex %s %s %s\n"
-                                        % (
-                                            str(self.j["vertices"][t[1]][0]),
-                                            str(self.j["vertices"][t[1]][1]),
-                                            str(self.j["vertices"][t[1]][2]),
-                                        )
-                                    )
-                                    out.write(
-                                        "vertex %s %s %s\n"
-                                        % (
-                                            str(self.j["vertices"][t[2]][0]),
-                                            str(self.j["vertices"][t[2]][1]),
-                                            str(self.j["vertices"][t[2]][2]),
-                                        )
-                                    )
-                                    out.write("endloop\nendfacet\n")
+                        for face in shell:
+                            write_facets(face)
         out.write("endsolid")
         return out
 
@@ -1767,22 +1883,27 @@ class CityJSON:
         tg = TransformerGroup(crs_in, crs_out, always_xy=False)
         tg.download_grids(verbose=True)
 
-        with progressbar(self.j["vertices"]) as vertices:
-            for v in vertices:
-                x, y, z = tg.transformers[0].transform(v[0], v[1], v[2])
-                v[0] = x
-                v[1] = y
-                v[2] = z
+        # -- the vertices are transformed by chunks of arrays (one call to pyproj
+        # -- for each chunk), the progress bar is updated after each chunk
+        transformer = tg.transformers[0]
+        vertices = self.j["vertices"]
+        chunk = 100_000
+        with progressbar(length=len(vertices)) as bar:
+            for i in range(0, len(vertices), chunk):
+                v = np.asarray(vertices[i : i + chunk], dtype=np.float64)
+                x, y, z = transformer.transform(v[:, 0], v[:, 1], v[:, 2])
+                vertices[i : i + chunk] = np.column_stack((x, y, z)).tolist()
+                bar.update(len(v))
         self.set_epsg(epsg)
         self.update_bbox()
         self.update_bbox_each_cityobjects(False)
         self.compress(imp_digits)
 
     def remove_attribute(self, attr):
-        for co in self.j["CityObjects"]:
-            if "attributes" in self.j["CityObjects"][co]:
-                if attr in self.j["CityObjects"][co]["attributes"]:
-                    del self.j["CityObjects"][co]["attributes"][attr]
+        for co in self.j["CityObjects"].values():
+            attributes = co.get("attributes")
+            if attributes is not None and attr in attributes:
+                del attributes[attr]
 
     def extract_lod(self, thelod):
         def lod_to_string(lod):
@@ -1798,24 +1919,19 @@ class CityJSON:
                 raise ValueError(f"Type {type(lod)} is not allowed as input")
 
     def rename_attribute(self, oldattr, newattr):
-        for co in self.j["CityObjects"]:
-            if "attributes" in self.j["CityObjects"][co]:
-                if oldattr in self.j["CityObjects"][co]["attributes"]:
-                    tmp = self.j["CityObjects"][co]["attributes"][oldattr]
-                    self.j["CityObjects"][co]["attributes"][newattr] = tmp
-                    del self.j["CityObjects"][co]["attributes"][oldattr]
+        for co in self.j["CityObjects"].values():
+            attributes = co.get("attributes")
+            if attributes is not None and oldattr in attributes:
+                tmp = attributes[oldattr]
+                attributes[newattr] = tmp
+                del attributes[oldattr]
 
     def filter_lod(self, thelod):
-        for co in self.j["CityObjects"]:
-            re = []
-            if "geometry" in self.j["CityObjects"][co]:
-                for i, g in enumerate(self.j["CityObjects"][co]["geometry"]):
-                    if str(g["lod"]) != thelod:
-                        re.append(g)
-                for each in re:
-                    self.j["CityObjects"][co]["geometry"].remove(each)
-        self.remove_duplicate_vertices()
-        self.remove_orphan_vertices()
+        for co in self.j["CityObjects"].values():
+            geoms = co.get("geometry")
+            if geoms is not None:
+                geoms[:] = [g for g in geoms if str(g["lod"]) == thelod]
+        self._remap_and_compact_vertices()
         self.update_bbox()
 
     def translate(self, minxyz: list = None):
@@ -1863,369 +1979,119 @@ class CityJSON:
 
         :param sloppy: A boolean, True=mapbox-earcut False=Shewchuk-robust
         """
-        vnp = np.array(self.j["vertices"])
-        for theid in self.j["CityObjects"]:
-            if "geometry" not in self.j["CityObjects"][theid]:
-                continue
-            for geom in self.j["CityObjects"][theid]["geometry"]:
-                sflag = False
-                mflag = False
-                tflag = False
-                slist = []
-                mlist = []
-                texlist = []
-                material = {}
-                texture = {}
-                # 1.semantics
-                if "semantics" in geom:
-                    sflag = True
-                # 2. materials
-                if "material" in geom:
-                    material = geom["material"]
-                    for item in material.items():
-                        if list(item[1].keys())[0] == "value":
-                            mlist.append(item[1]["value"])
-                        elif list(item[1].keys())[0] == "values":
-                            mlist.append([])
-                    mflag = True
-                # 3. texture
-                if "texture" in geom:
-                    texture = geom["texture"]
-                    tkeys = []
-                    for item in texture.items():
-                        texlist.append([])
-                    for key in texture.keys():
-                        tkeys.append(key)
-                    tflag = True
-
-                # triangulate the geometry type MultiSurface and CompositeSurface
-                if (geom["type"] == "MultiSurface") or (
-                    geom["type"] == "CompositeSurface"
-                ):
-                    tlist1 = []
-                    for i, face in enumerate(geom["boundaries"]):
-                        tposition = 0
-                        tmaplist = []
-                        if tflag:
-                            for key in tkeys:
-                                tmap = {}
-                                for ii, f in enumerate(face):
-                                    for iii, ff in enumerate(f):
-                                        if texture[key]["values"][i][ii][0] is None:
-                                            break
-                                        else:
-                                            tposition = texture[key]["values"][i][ii][0]
-                                            tmap[ff] = texture[key]["values"][i][ii][
-                                                iii + 1
-                                            ]
-                                tmaplist.append(tmap)
-                        if (len(face) == 1) and (len(face[0]) == 3):
-                            re = np.array(face)
-                            b = True
+        vnp = np.asarray(self.j["vertices"], dtype=np.float64).reshape(-1, 3)
+
+        def triangulate_surfaces(surfaces, svalues, mvalues, tvalues):
+            # -- a list of surfaces (a MultiSurface or a shell); each triangle gets
+            # -- the semantics/materials of its surface and the texture
+            # -- coordinates of its vertices
+            boundaries = []
+            semantics = None if svalues is None else []
+            materials = [None if mv is None else [] for mv in mvalues]
+            mpairs = [(m, mv) for m, mv in zip(materials, mvalues) if m is not None]
+            textures = [[] for tv in tvalues]
+            for i, face in enumerate(surfaces):
+                if tvalues:
+                    # -- vertex -> texture coordinates, for each theme (done before
+                    # -- the triangulation, which can modify the face)
+                    tmaps = []
+                    for tv in tvalues:
+                        tposition = None
+                        tmap = {}
+                        for ring, rv in zip(face, tv[i]):
+                            if rv[0] is not None:
+                                tposition = rv[0]
+                                tmap.update(zip(ring, rv[1:]))
+                        tmaps.append((tposition, tmap))
+                # -- the triangles, each already as a surface with one ring
+                if (len(face) == 1) and (len(face[0]) == 3):
+                    tris = [[list(face[0])]]
+                else:
+                    re, b = geom_help.triangulate_face(face, vnp, sloppy)
+                    if not b:
+                        continue
+                    tris = re.reshape(-1, 1, 3).tolist()
+                boundaries.extend(tris)
+                if semantics is not None:
+                    semantics.extend([svalues[i]] * len(tris))
+                for m, mv in mpairs:
+                    m.extend([mv[i]] * len(tris))
+                if tvalues:
+                    for tex, (tposition, tmap) in zip(textures, tmaps):
+                        if tmap:
+                            tex.extend(
+                                [
+                                    [[tposition, *map(tmap.__getitem__, t)]]
+                                    for (t,) in tris
+                                ]
+                            )
                         else:
-                            re, b = geom_help.triangulate_face(face, vnp, sloppy)
-                            # re, b = geom_help.triangulate_face(face, vnp)
-
-                        if b:
-                            for t in re:
-                                tlist2 = []
-                                tlist2.append(t.tolist())
-                                tlist1.append(tlist2)
-
-                                if sflag:
-                                    if geom["semantics"]["values"] is None:
-                                        slist = None
-                                        break
-                                    else:
-                                        slist.append(geom["semantics"]["values"][i])
-
-                                if mflag:
-                                    for j, ls in enumerate(mlist):
-                                        if type(ls).__name__ == "list":
-                                            ls.append(
-                                                material[list(material.keys())[j]][
-                                                    "values"
-                                                ][i]
-                                            )
-                                        else:
-                                            continue
-
-                                if tflag:
-                                    for jj in range(len(tmaplist)):
-                                        texlist1 = []
-                                        texlist2 = [tposition]
-
-                                        if bool(tmaplist[jj]):
-                                            for vindex in t:
-                                                texlist2.append(tmaplist[jj][vindex])
-                                        else:
-                                            texlist2[0] = None
-                                        texlist1.append(texlist2)
-                                        texlist[jj].append(texlist1)
-
-                    geom["boundaries"] = tlist1
-                    if sflag:
-                        geom["semantics"]["values"] = slist
-
-                    if mflag:
-                        for j, item in enumerate(material.items()):
-                            item[1][list(item[1].keys())[0]] = mlist[j]
-                        geom["material"] = material
-
-                    if tflag:
-                        for j, item in enumerate(texture.items()):
-                            item[1][list(item[1].keys())[0]] = texlist[j]
-                        geom["texture"] = texture
-
-                # triangulate the geometry type Solid
-                elif geom["type"] == "Solid":
-                    tlist1 = []
-                    minit = copy.deepcopy(mlist)
-                    texinit = copy.deepcopy(texlist)
-                    for sidx, shell in enumerate(geom["boundaries"]):
-                        slist1 = []
-                        tlist2 = []
-                        texlist0 = copy.deepcopy(texinit)
-                        mlist1 = copy.deepcopy(minit)
-                        for i, face in enumerate(shell):
-                            tposition = 0
-                            tmaplist = []
-                            if tflag:
-                                for key in tkeys:
-                                    tmap = {}
-                                    for ii, f in enumerate(face):
-                                        for iii, ff in enumerate(f):
-                                            if (
-                                                texture[key]["values"][sidx][i][ii][0]
-                                                is None
-                                            ):
-                                                break
-                                            else:
-                                                tposition = texture[key]["values"][
-                                                    sidx
-                                                ][i][ii][0]
-                                                tmap[ff] = texture[key]["values"][sidx][
-                                                    i
-                                                ][ii][iii + 1]
-                                    tmaplist.append(tmap)
-                            if (len(face) == 1) and (len(face[0]) == 3):
-                                re = np.array(face)
-                                b = True
-                            else:
-                                re, b = geom_help.triangulate_face(face, vnp, sloppy)
-                            if b:
-                                for t in re:
-                                    tlist3 = []
-                                    tlist3.append(t.tolist())
-                                    tlist2.append(tlist3)
-                                    if sflag:
-                                        if geom["semantics"]["values"] is None:
-                                            slist = None
-                                            break
-                                        elif geom["semantics"]["values"][sidx] is None:
-                                            slist1 = None
-                                            break
-                                        else:
-                                            slist1.append(
-                                                geom["semantics"]["values"][sidx][i]
-                                            )
-                                    if mflag:
-                                        for j, ls in enumerate(mlist1):
-                                            if type(ls).__name__ == "list":
-                                                ls.append(
-                                                    material[list(material.keys())[j]][
-                                                        "values"
-                                                    ][0][i]
-                                                )
-                                            else:
-                                                continue
-
-                                    if tflag:
-                                        for jj in range(len(tmaplist)):
-                                            texlist1 = []
-                                            texlist2 = [tposition]
-
-                                            if bool(tmaplist[jj]):
-                                                for vindex in t:
-                                                    texlist2.append(
-                                                        tmaplist[jj][vindex]
-                                                    )
-                                            else:
-                                                texlist2[0] = None
-                                            texlist1.append(texlist2)
-                                            texlist0[jj].append(texlist1)
-
-                        tlist1.append(tlist2)
-                        if slist is not None:
-                            slist.append(slist1)
-                        for j, ls in enumerate(mlist):
-                            if type(ls).__name__ == "list" and len(mlist1[j]) != 0:
-                                ls.append(mlist1[j])
-                            else:
-                                continue
-                        for j, ls in enumerate(texlist):
-                            ls.append(texlist0[j])
-
-                    geom["boundaries"] = tlist1
-                    if sflag:
-                        geom["semantics"]["values"] = slist
-
-                    if mflag:
-                        for j, item in enumerate(material.items()):
-                            item[1][list(item[1].keys())[0]] = mlist[j]
-                        geom["material"] = material
-
-                    if tflag:
-                        for j, item in enumerate(texture.items()):
-                            item[1][list(item[1].keys())[0]] = texlist[j]
-                        geom["texture"] = texture
-
-                # triangulate the geometry type MultiSolid and CompositeSolid
-                elif (geom["type"] == "MultiSolid") or (
-                    geom["type"] == "CompositeSolid"
-                ):
-                    tlist1 = []
-                    minit = copy.deepcopy(mlist)
-                    texinit = copy.deepcopy(texlist)
-                    for solididx, solid in enumerate(geom["boundaries"]):
-                        slist1 = []
-                        tlist2 = []
-                        mlist1 = copy.deepcopy(minit)
-                        texlist0 = copy.deepcopy(texinit)
-                        for sidx, shell in enumerate(solid):
-                            slist2 = []
-                            tlist3 = []
-                            mlist2 = copy.deepcopy(minit)
-                            texlist1 = copy.deepcopy(texinit)
-                            for i, face in enumerate(shell):
-                                tposition = 0
-                                tmaplist = []
-                                if tflag:
-                                    for key in tkeys:
-                                        tmap = {}
-                                        for ii, f in enumerate(face):
-                                            for iii, ff in enumerate(f):
-                                                if (
-                                                    texture[key]["values"][solididx][
-                                                        sidx
-                                                    ][i][ii][0]
-                                                    is None
-                                                ):
-                                                    break
-                                                else:
-                                                    tposition = texture[key]["values"][
-                                                        solididx
-                                                    ][sidx][i][ii][0]
-                                                    tmap[ff] = texture[key]["values"][
-                                                        solididx
-                                                    ][sidx][i][ii][iii + 1]
-                                        tmaplist.append(tmap)
-                                if (len(face) == 1) and (len(face[0]) == 3):
-                                    re = np.array(face)
-                                    b = True
-                                else:
-                                    re, b = geom_help.triangulate_face(
-                                        face, vnp, sloppy
-                                    )
-                                if b:
-                                    for t in re:
-                                        tlist4 = []
-                                        tlist4.append(t.tolist())
-                                        tlist3.append(tlist4)
-
-                                        if sflag:
-                                            if geom["semantics"]["values"] is None:
-                                                slist = None
-                                                break
-                                            if (
-                                                geom["semantics"]["values"][solididx]
-                                                is None
-                                            ):
-                                                slist1 = None
-                                                break
-                                            elif (
-                                                geom["semantics"]["values"][solididx][
-                                                    sidx
-                                                ]
-                                                is None
-                                            ):
-                                                slist2 = None
-                                                break
-                                            else:
-                                                slist2.append(
-                                                    geom["semantics"]["values"][
-                                                        solididx
-                                                    ][sidx][i]
-                                                )
-
-                                        if mflag:
-                                            for j, ls in enumerate(mlist2):
-                                                if type(ls).__name__ == "list":
-                                                    ls.append(
-                                                        material[
-                                                            list(material.keys())[j]
-                                                        ]["values"][0][0][i]
-                                                    )
-                                                else:
-                                                    continue
-
-                                        if tflag:
-                                            for jj in range(len(tmaplist)):
-                                                texlist2 = []
-                                                texlist3 = [tposition]
-
-                                                if bool(tmaplist[jj]):
-                                                    for vindex in t:
-                                                        texlist3.append(
-                                                            tmaplist[jj][vindex]
-                                                        )
-                                                else:
-                                                    texlist3[0] = None
-                                                texlist2.append(texlist3)
-                                                texlist1[jj].append(texlist2)
-
-                            tlist2.append(tlist3)
-                            if slist1 is not None:
-                                slist1.append(slist2)
-                            for j, ls in enumerate(mlist1):
-                                if type(ls).__name__ == "list" and len(mlist2[j]) != 0:
-                                    ls.append(mlist2[j])
-                                else:
-                                    continue
-                            for j, ls in enumerate(texlist0):
-                                ls.append(texlist1[j])
-
-                        tlist1.append(tlist2)
-                        if slist is not None:
-                            slist.append(slist1)
-                        for j, ls in enumerate(mlist):
-                            if type(ls).__name__ == "list" and len(mlist1[j]) != 0:
-                                ls.append(mlist1[j])
-                            else:
-                                continue
-                        for j, ls in enumerate(texlist):
-                            ls.append(texlist0[j])
-
-                    geom["boundaries"] = tlist1
-                    if sflag:
-                        geom["semantics"]["values"] = slist
-                    if mflag:
-                        for j, item in enumerate(material.items()):
-                            item[1][list(item[1].keys())[0]] = mlist[j]
-                        geom["material"] = material
-                    if tflag:
-                        for j, item in enumerate(texture.items()):
-                            item[1][list(item[1].keys())[0]] = texlist[j]
-                        geom["texture"] = texture
+                            tex.extend([[[None]] for t in tris])
+            return boundaries, semantics, materials, textures
+
+        def triangulate_level(boundaries, depth, svalues, mvalues, tvalues):
+            # -- depth is the number of list levels above the surfaces: 1 for a
+            # -- MultiSurface, 2 for a Solid (its shells), 3 for a MultiSolid
+            if depth == 1:
+                return triangulate_surfaces(boundaries, svalues, mvalues, tvalues)
+            newb = []
+            semantics = None if svalues is None else []
+            materials = [None if mv is None else [] for mv in mvalues]
+            textures = [[] for tv in tvalues]
+            for k, sub in enumerate(boundaries):
+                b, s, ms, ts = triangulate_level(
+                    sub,
+                    depth - 1,
+                    None if svalues is None else svalues[k],
+                    [None if mv is None else mv[k] for mv in mvalues],
+                    [tv[k] for tv in tvalues],
+                )
+                newb.append(b)
+                if semantics is not None:
+                    semantics.append(s)
+                for m, each in zip(materials, ms):
+                    if m is not None:
+                        m.append(each)
+                for tex, each in zip(textures, ts):
+                    tex.append(each)
+            return newb, semantics, materials, textures
+
+        for co in self.j["CityObjects"].values():
+            if "geometry" not in co:
+                continue
+            for geom in co["geometry"]:
+                depth = SURFACE_DEPTHS.get(geom["type"])
+                if depth is None:
+                    continue
+                semantics = geom.get("semantics")
+                # -- the materials with one 'value' for the geometry are kept as is
+                mthemes = [
+                    m for m in geom.get("material", {}).values() if "values" in m
+                ]
+                tthemes = list(geom.get("texture", {}).values())
+                b, s, ms, ts = triangulate_level(
+                    geom["boundaries"],
+                    depth,
+                    None if semantics is None else semantics["values"],
+                    [m["values"] for m in mthemes],
+                    [t["values"] for t in tthemes],
+                )
+                geom["boundaries"] = b
+                if semantics is not None:
+                    semantics["values"] = s
+                for m, values in zip(mthemes, ms):
+                    m["values"] = values
+                for t, values in zip(tthemes, ts):
+                    t["values"] = values
 
     def is_triangulated(self):
         """
         Check if the CityJSON file is *fully* triangulated. Return true if it's triangulated, return false if it's not.
         """
 
-        for theid in self.j["CityObjects"]:
-            if "geometry" in self.j["CityObjects"][theid]:
-                for geom in self.j["CityObjects"][theid]["geometry"]:
+        for co in self.j["CityObjects"].values():
+            if "geometry" in co:
+                for geom in co["geometry"]:
                     if (geom["type"] == "MultiSurface") or (
                         geom["type"] == "CompositeSurface"
                     ):
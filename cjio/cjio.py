@@ -1,4 +1,3 @@
-import copy
 import glob
 import json
 import os.path
@@ -19,10 +18,6 @@ from cjio import (
     MODULE_EARCUT_AVAILABLE,
     MODULE_CJVAL_AVAILABLE,
 )
-from cjio.floatEncoder import FloatEncoder
-
-json.encoder.c_make_encoder = None
-json.encoder.float = FloatEncoder
 
 
 # -- https://stackoverflow.com/questions/47437472/in-python-click-how-do-i-see-help-for-subcommands-whose-parents-have-required
@@ -45,7 +40,7 @@ class PerCommandArgWantSubCmdHelp(click.Argument):
 @click.group(chain=True)
 @click.version_option(
     version=cjio.__version__,
-    prog_name=cityjson.CITYJSON_VERSIONS_SUPPORTED[-1],
+    prog_name=cityjson.CITYJSON_VERSION_LATEST,
     message="cjio v%(version)s; supports CityJSON v%(prog)s",
 )
 @click.argument("input", cls=PerCommandArgWantSubCmdHelp)
@@ -127,7 +122,7 @@ def print_cmd():
     """Print the (pretty formatted) JSON to the console."""
 
     def processor(cm):
-        json_str = json.dumps(cm.j, indent="  ")
+        json_str = cityjson.dumps(cm.j, indent="  ")
         print_cmd_info(json_str)
         return cm
 
@@ -193,22 +188,18 @@ def export_cmd(filename, format, sloppy):
         # ---------- OBJ ----------
         if format.lower() == "obj":
             if stdoutoutput:
-                buf = cm.export2obj(sloppy)
-                buf.seek(0)
-                for line in buf.readlines():
-                    sys.stdout.write(line)
+                cm.export2obj(sloppy, out=sys.stdout)
             else:
                 print_cmd_status("Exporting CityJSON to OBJ (%s)" % (output["path"]))
                 try:
                     mtl_path = Path(output["path"]).with_suffix(".mtl")
-                    re = cm.export2obj(sloppy, mtl_path.name)
+                    # Write .obj, as it is generated
+                    with click.open_file(output["path"], mode="w") as fo:
+                        re = cm.export2obj(sloppy, mtl_path.name, out=fo)
                     if isinstance(re, tuple):  # MTL file returned
-                        obj, mtl = re[0], re[1]
+                        mtl = re[1]
                     else:
-                        obj, mtl = re, None
-                    # Write .obj
-                    with click.open_file(output["path"], mode="w") as fo:
-                        fo.write(obj.getvalue())
+                        mtl = None
                     if mtl is not None:
                         # Write optional .mtl
                         with click.open_file(str(mtl_path), mode="w") as fmtl:
@@ -220,16 +211,12 @@ def export_cmd(filename, format, sloppy):
         # ---------- STL ----------
         elif format.lower() == "stl":
             if stdoutoutput:
-                buf = cm.export2stl(sloppy)
-                buf.seek(0)
-                for line in buf.readlines():
-                    sys.stdout.write(line)
+                cm.export2stl(sloppy, out=sys.stdout)
             else:
                 print_cmd_status("Exporting CityJSON to STL (%s)" % (output["path"]))
                 try:
                     with click.open_file(output["path"], mode="w") as fo:
-                        re = cm.export2stl(sloppy)
-                        fo.write(re.getvalue())
+                        cm.export2stl(sloppy, out=fo)
                 except IOError as e:
                     raise click.ClickException(
                         'Invalid output file: "%s".\n%s' % (output["path"], e)
@@ -274,21 +261,21 @@ def export_cmd(filename, format, sloppy):
         elif format.lower() == "jsonl":
             if stdoutoutput:
                 with warnings.catch_warnings(record=True) as w:
-                    buf = cm.export2jsonl()
+                    # -- the lines are written as bytes, after what is pending
+                    sys.stdout.flush()
+                    cm.export2jsonl(sys.stdout.buffer)
                     print_cmd_warning(w)
-                buf.seek(0)
-                for line in buf.readlines():
-                    sys.stdout.write(line)
             else:
                 print_cmd_status(
                     "Exporting CityJSON to JSON Lines (%s)" % (output["path"])
                 )
                 try:
-                    with click.open_file(output["path"], mode="w") as fo:
-                        with warnings.catch_warnings(record=True) as w:
-                            re = cm.export2jsonl()
-                            print_cmd_warning(w)
-                        fo.write(re.getvalue())
+                    with (
+                        click.open_file(output["path"], mode="wb") as fo,
+                        warnings.catch_warnings(record=True) as w,
+                    ):
+                        cm.export2jsonl(fo)
+                        print_cmd_warning(w)
                 except IOError as e:
                     raise click.ClickException(
                         'Invalid output file: "%s".\n%s' % (output["path"], e)
@@ -349,21 +336,21 @@ def save_cmd(filename, indent, textures):
                 os.makedirs(os.path.dirname(output["path"]), exist_ok=True)
         if stdoutoutput:
             if indent:
-                json_str = json.dumps(cm.j, indent="\t")
+                json_str = cityjson.dumps(cm.j, indent="\t")
                 sys.stdout.write(json_str)
             else:
-                json_str = json.dumps(cm.j, separators=(",", ":"))
+                json_str = cityjson.dumps(cm.j)
                 sys.stdout.write(json_str)
         else:
             print_cmd_status("Saving CityJSON to a file %s" % output["path"])
             try:
-                fo = click.open_file(output["path"], mode="w")
+                fo = click.open_file(output["path"], mode="w", encoding="utf-8")
                 if textures:
                     cm.copy_textures(textures)
                 if indent:
-                    json_str = json.dumps(cm.j, indent="\t")
+                    json_str = cityjson.dumps(cm.j, indent="\t")
                 else:
-                    json_str = json.dumps(cm.j, separators=(",", ":"))
+                    json_str = cityjson.dumps(cm.j)
                 fo.write(json_str)
             except IOError as e:
                 raise click.ClickException(
@@ -485,18 +472,21 @@ def subset_cmd(id, bbox, random, cotype, radius, exclude):
 
     def processor(cm):
         print_cmd_status("Subset of CityJSON")
-        s = copy.deepcopy(cm)
+        s = cm
+        # -- the input model is not used after this, it is subset in place
         if random is not None:
-            s = s.get_subset_random(random, exclude=exclude)
+            s = s.get_subset_random(random, exclude=exclude, inplace=True)
             return s
         elif radius is not None and len(radius) > 0:
-            s = s.get_subset_radius(radius[0], radius[1], radius[2], exclude=exclude)
+            s = s.get_subset_radius(
+                radius[0], radius[1], radius[2], exclude=exclude, inplace=True
+            )
         elif id is not None and len(id) > 0:
-            s = s.get_subset_ids(id, exclude=exclude)
+            s = s.get_subset_ids(id, exclude=exclude, inplace=True)
         elif bbox is not None and len(bbox) > 0:
-            s = s.get_subset_bbox(bbox, exclude=exclude)
+            s = s.get_subset_bbox(bbox, exclude=exclude, inplace=True)
         elif cotype is not None:
-            s = s.get_subset_cotype(cotype, exclude=exclude)
+            s = s.get_subset_cotype(cotype, exclude=exclude, inplace=True)
         else:
             click.BadArgumentUsage(
                 "You must provide one of the options for subset; --id, --bbox, --random, --cotype"
@@ -622,7 +612,7 @@ def upgrade_cmd(digit):
     """
 
     def processor(cm):
-        vlatest = cityjson.CITYJSON_VERSIONS_SUPPORTED[-1]
+        vlatest = cityjson.CITYJSON_VERSION_LATEST
         print_cmd_status("Upgrade CityJSON file to v%s" % vlatest)
         re, reasons = cm.upgrade_version(vlatest, digit)
         if not re:
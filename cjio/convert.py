@@ -1,3 +1,4 @@
+from collections import defaultdict
 from io import BytesIO
 import json
 
@@ -5,7 +6,7 @@ from cjio import geom_help
 
 import numpy as np
 
-from cjio.geom_help import triangle_normal, average_normal
+from cjio.geom_help import triangle_normals, average_normal
 
 
 def flatten(x):
@@ -18,6 +19,22 @@ def flatten(x):
     return result
 
 
+def add_vertex_normals(tris, vertexlist, normals_per_vertex):
+    """Append the area-weighted normal of each triangle to the lists of its vertices
+
+    The normals are inverted, as glTF needs them.
+    """
+    if len(tris) == 0:
+        return
+    # -- only the first 3 vertices of a ring are used if it is not a triangle
+    normals, valid = triangle_normals([t[:3] for t in tris], vertexlist, weighted=True)
+    for t, tri_normal, b in zip(tris, normals * -1.0, valid.tolist()):
+        if b:
+            normals_per_vertex[t[0]].append(tri_normal)
+            normals_per_vertex[t[1]].append(tri_normal)
+            normals_per_vertex[t[2]].append(tri_normal)
+
+
 def byte_offset(x, byte_boundary):
     """Compute the byteOffset for glTF bufferView
 
@@ -230,7 +247,7 @@ def to_glb(cm, do_triangulate=True):
 
             if do_triangulate:
                 for geom in cm.j["CityObjects"][theid]["geometry"]:
-                    normals_per_vertex = {i: [] for i in range(len(vertexlist))}
+                    normals_per_vertex = defaultdict(list)
                     poscount = poscount + 1
                     if geom["type"] == "Solid":
                         triList = []
@@ -242,20 +259,12 @@ def to_glb(cm, do_triangulate=True):
                                 if success:
                                     for t in tri:
                                         triList.append(list(t))
-                                        tri_normal = triangle_normal(
-                                            t, vertexlist, weighted=True
-                                        )
-                                        if tri_normal is not None:
-                                            # for gltf, we need to invert the vector
-                                            tri_normal = tri_normal * -1.0
-                                            normals_per_vertex[t[0]].append(tri_normal)
-                                            normals_per_vertex[t[1]].append(tri_normal)
-                                            normals_per_vertex[t[2]].append(tri_normal)
                                 else:
                                     # TODO: logging
                                     print(
                                         f"Failed to triangulate face in CityObject {theid}"
                                     )
+                        add_vertex_normals(triList, vertexlist, normals_per_vertex)
                         trigeom = flatten(triList)
 
                     elif (geom["type"] == "MultiSurface") or (
@@ -267,29 +276,21 @@ def to_glb(cm, do_triangulate=True):
                             if success:
                                 for t in tri:
                                     triList.append(list(t))
-                                    tri_normal = triangle_normal(
-                                        t, vertexlist, weighted=True
-                                    )
-                                    if tri_normal is not None:
-                                        tri_normal = tri_normal * -1.0
-                                        normals_per_vertex[t[0]].append(tri_normal)
-                                        normals_per_vertex[t[1]].append(tri_normal)
-                                        normals_per_vertex[t[2]].append(tri_normal)
                             else:
                                 # TODO: logging
                                 print(
                                     f"Failed to triangulate face in CityObject {theid}"
                                 )
+                        add_vertex_normals(triList, vertexlist, normals_per_vertex)
                         trigeom = flatten(triList)
 
                     forimax.append(trigeom)
                     # Computing smooth-shading (smooth-normal) for a vertex, as the sum of
                     # normals weighted by the triangle area of the adjacent triangles.
+                    # (only for the vertices of this geometry)
                     normals_per_vertex_smooth = {
-                        i: None for i in range(len(vertexlist))
+                        v: average_normal(normals_per_vertex[v]) for v in set(trigeom)
                     }
-                    for v, normals in normals_per_vertex.items():
-                        normals_per_vertex_smooth[v] = average_normal(normals)
                     del normals_per_vertex
                     normals_per_geom.append(
                         list(normals_per_vertex_smooth[v] for v in trigeom)
@@ -298,7 +299,7 @@ def to_glb(cm, do_triangulate=True):
                 # If the caller says it's triangulate, then we trust that it's
                 # triangulated.
                 for geom in cm.j["CityObjects"][theid]["geometry"]:
-                    normals_per_vertex = {i: [] for i in range(len(vertexlist))}
+                    normals_per_vertex = defaultdict(list)
                     poscount = poscount + 1
                     if geom["type"] == "Solid":
                         triList = []
@@ -306,15 +307,7 @@ def to_glb(cm, do_triangulate=True):
                             for face in shell:
                                 for t in face:
                                     triList.append(t)
-                                    tri_normal = triangle_normal(
-                                        t, vertexlist, weighted=True
-                                    )
-                                    if tri_normal is not None:
-                                        tri_normal = tri_normal * -1.0
-                                        normals_per_vertex[t[0]].append(tri_normal)
-                                        normals_per_vertex[t[1]].append(tri_normal)
-                                        normals_per_vertex[t[2]].append(tri_normal)
-
+                        add_vertex_normals(triList, vertexlist, normals_per_vertex)
                         trigeom = flatten(triList)
 
                     elif (geom["type"] == "MultiSurface") or (
@@ -324,24 +317,16 @@ def to_glb(cm, do_triangulate=True):
                         for face in geom["boundaries"]:
                             for t in face:
                                 triList.append(t)
-                                tri_normal = triangle_normal(
-                                    t, vertexlist, weighted=True
-                                )
-                                if tri_normal is not None:
-                                    tri_normal = tri_normal * -1.0
-                                    normals_per_vertex[t[0]].append(tri_normal)
-                                    normals_per_vertex[t[1]].append(tri_normal)
-                                    normals_per_vertex[t[2]].append(tri_normal)
+                        add_vertex_normals(triList, vertexlist, normals_per_vertex)
                         trigeom = flatten(triList)
 
                     forimax.append(trigeom)
                     # Computing smooth-shading (smooth-normal) for a vertex, as the sum of
                     # normals weighted by the triangle area of the adjacent triangles.
+                    # (only for the vertices of this geometry)
                     normals_per_vertex_smooth = {
-                        i: None for i in range(len(vertexlist))
+                        v: average_normal(normals_per_vertex[v]) for v in set(trigeom)
                     }
-                    for v, normals in normals_per_vertex.items():
-                        normals_per_vertex_smooth[v] = average_normal(normals)
                     del normals_per_vertex
                     normals_per_geom.append(
                         list(normals_per_vertex_smooth[v] for v in trigeom)
@@ -359,28 +344,22 @@ def to_glb(cm, do_triangulate=True):
 
             # ----- buffer and bufferView
             # allocate for vertex coordinates
+            # (the rows of invalid vertex indices stay at zero)
             vtx_np = np.zeros((len(flatgeom), 3))
-            # allocate for vertex indices
-            vtx_idx_np = np.zeros(len(flatgeom))
             # need to reindex the vertices, otherwise if the vtx index exceeds the nr. of vertices in the
             # accessor then we get "ACCESSOR_INDEX_OOB" error
-            for i, v in enumerate(flatgeom):
-                try:
-                    vtx_np[i] = np.array(
-                        (vertexlist[v][0], vertexlist[v][1], vertexlist[v][2])
-                    )
-                except IndexError:
-                    print(i, v)
-                vtx_idx_np[i] = i
+            vtx_idx_np = np.arange(len(flatgeom))
+            idx = np.asarray(flatgeom, dtype=np.int64)
+            valid = (idx >= -len(vertexlist)) & (idx < len(vertexlist))
+            for i in np.flatnonzero(~valid).tolist():
+                print(i, flatgeom[i])
+            vtx_np[valid] = vertexlist[idx[valid]]
             bin_vtx = vtx_np.astype(np.float32).tobytes()
             # convert geometry indices to binary
             bin_geom = vtx_idx_np.astype(np.uint32).tobytes()
             del flatgeom
             # convert the normal to binary
             bin_normals = normals_np.astype(np.float32).tobytes()
-            # convert batchid to binary
-            batchid_np = np.array([i for g in vtx_idx_np])
-            _ = batchid_np.astype(np.uint32).tobytes()
 
             # -- geometry indices bufferView
             bpos = len(gltf_bin)
@@ -682,18 +661,30 @@ def faces_to_obj(faces, out, sloppy, vnp, texture_values=None, textures=None):
                     ):  # t[0] is the material, t[1:] are the texture coordinates
                         v_t_map[v] = vt
         if b:
-            for v in re:
-                if v_t_map is not None and current_material is not None:
-                    out.write(
-                        "f %d/%d %d/%d %d/%d\n"
-                        % (
-                            v[0] + 1,
-                            v_t_map[v[0]] + 1,
-                            v[1] + 1,
-                            v_t_map[v[1]] + 1,
-                            v[2] + 1,
-                            v_t_map[v[2]] + 1,
-                        )
+            # -- all the triangles of the face are written at once
+            if v_t_map is not None and current_material is not None:
+                out.write(
+                    "".join(
+                        [
+                            "f %d/%d %d/%d %d/%d\n"
+                            % (
+                                v0 + 1,
+                                v_t_map[v0] + 1,
+                                v1 + 1,
+                                v_t_map[v1] + 1,
+                                v2 + 1,
+                                v_t_map[v2] + 1,
+                            )
+                            for v0, v1, v2 in re.tolist()
+                        ]
+                    )
+                )
+            else:
+                out.write(
+                    "".join(
+                        [
+                            "f %d %d %d\n" % (v0 + 1, v1 + 1, v2 + 1)
+                            for v0, v1, v2 in re.tolist()
+                        ]
                     )
-                else:
-                    out.write("f %d %d %d\n" % (v[0] + 1, v[1] + 1, v[2] + 1))
+                )
@@ -16,7 +16,9 @@ except ImportError:
 
 
 def to_2d(p, n):
-    # -- n must be normalised
+    """Project the point p, or the (N, 3) array of points p, on the plane with
+    the normal n (which must be normalised). Returns the x and y coordinates.
+    """
     # p = np.array([1, 2, 3])
     # newell = np.array([1, 3, 4.2])
     # n = newell/math.sqrt(p[0]*p[0] + p[1]*p[1] + p[2]*p[2])
@@ -26,34 +28,50 @@ def to_2d(p, n):
     x3 = x3 - np.dot(x3, n) * n
     # print(n, x3)
     x3 /= math.sqrt((x3**2).sum())  # make x a unit vector
-    y3 = np.cross(n, x3)
-    return (np.dot(p, x3), np.dot(p, y3))
+    # -- y = n x x, spelled out: np.cross costs more than the whole
+    # -- projection for the small faces of a city model
+    n0, n1, n2 = n.tolist()
+    x0, x1, x2 = x3.tolist()
+    y3 = np.array([n1 * x2 - n2 * x1, n2 * x0 - n0 * x2, n0 * x1 - n1 * x0])
+    if np.ndim(p) == 1:
+        return (np.dot(p, x3), np.dot(p, y3))
+    # -- a stack of (1, 3) @ (3, 2) products gives the same bits as np.dot on
+    # -- each point, a plain (N, 3) @ (3, 2) product does not
+    xy = (np.asarray(p)[:, None, :] @ np.column_stack((x3, y3)))[:, 0]
+    return (xy[:, 0], xy[:, 1])
 
 
 def get_normal_newell(poly):
     """
     Compute the normal vector of a polygon using Newell's method.
+
+    :param poly: the points of the polygon, array-like of shape (N, 3)
     """
-    n = np.array([0.0, 0.0, 0.0], dtype=np.float64)
-
-    for i, p in enumerate(poly):
-        if len(p) < 3:  # -- if it does not have 3 points then skip
-            continue
-        ne = i + 1
-        if ne == len(poly):
-            ne = 0
-        n[0] += (poly[i][1] - poly[ne][1]) * (poly[i][2] + poly[ne][2])
-        n[1] += (poly[i][2] - poly[ne][2]) * (poly[i][0] + poly[ne][0])
-        n[2] += (poly[i][0] - poly[ne][0]) * (poly[i][1] + poly[ne][1])
-
-    if (n == np.array([0.0, 0.0, 0.0])).all():
-        # print("one wrong")
+    p = np.asarray(poly, dtype=np.float64)
+    # -- not a list of 3D points, or fewer than 3 of them
+    if p.ndim != 2 or p.shape[1] != 3 or len(p) < 3:
+        return (np.zeros(3), False)
+    # -- the next point of each point, wrapping around
+    q = np.empty_like(p)
+    q[:-1] = p[1:]
+    q[-1:] = p[:1]
+    d = p - q
+    s = p + q
+    # -- the terms are added one after the other (a cumulative sum, not a dot
+    # -- product), so that the normal has the same bits as Newell's loop
+    n = np.cumsum(d[:, [1, 2, 0]] * s[:, [2, 0, 1]], axis=0)[-1]
+
+    if not n.any():
         return (n, False)
     n = n / math.sqrt(n[0] * n[0] + n[1] * n[1] + n[2] * n[2])
     return (n, True)
 
 
 def triangulate_face(face, vnp, sloppy=False):
+    # -- a triangle is returned as is (unless it has duplicate vertices, which
+    # -- Shewchuk's path removes first)
+    if (len(face) == 1) and (len(face[0]) == 3) and (len(set(face[0])) == 3):
+        return (np.array(face), True)
     if not sloppy:
         return triangulate_face_shewchuk(face, vnp)
     else:
@@ -66,11 +84,8 @@ def triangulate_face_shewchuk(face, vnp):
     # -- remove duplicate vertices, which can *easily* make Triangle segfault
     for i, each in enumerate(face):
         if len(set(each)) < len(each):  # -- there are duplicates
-            re = []
-            for k in each:
-                if re.count(k) == 0:
-                    re.append(k)
-            face[i] = re
+            # -- keep the first occurrence of each vertex, in order
+            face[i] = list(dict.fromkeys(each))
     # print(face)
     # print(len(face))
     if (len(face) == 1) and (len(face[0]) <= 3):
@@ -85,54 +100,43 @@ def triangulate_face_shewchuk(face, vnp):
         if len(ring) < 3:
             # -- if a triangle then do nothing
             return (np.zeros(1), False)
-    sf = np.array([], dtype=np.int64)
-    for ring in face:
-        sf = np.hstack((sf, np.array(ring)))
+    # -- all the rings in one array, rings holds the end index of each ring
+    lengths = [len(ring) for ring in face]
+    rings = np.cumsum(lengths, dtype=np.int64)
+    sf = np.empty(rings[-1], dtype=np.int64)
+    off = 0
+    for ring, length in zip(face, lengths):
+        sf[off : off + length] = ring
+        off += length
     sfv = vnp[sf]
 
-    rings = np.zeros(len(face), dtype=np.int64)
-    total = 0
-    for i in range(len(face)):
-        total += len(face[i])
-        rings[i] = total
-
     # 1. normal with Newell's method
     n, b = get_normal_newell(sfv)
 
     # 2. project to the plane to get xy
-    sfv2d = np.zeros((sfv.shape[0], 2))
-    for i, p in enumerate(sfv):
-        xy = to_2d(p, n)
-        sfv2d[i][0] = xy[0]
-        sfv2d[i][1] = xy[1]
+    sfv2d = np.column_stack(to_2d(sfv, n))
 
     # -- 3. deal with segments/constraints, prepare the Triangle input
-    sg = np.zeros((rings[-1], 2), dtype=np.int64)
-    for i, e in enumerate(sg):
-        sg[i][0] = i
-        sg[i][1] = i + 1
-    starti = 0
-    for each in rings:
-        sg[each - 1][1] = starti
-        starti = each
+    # -- segment i joins vertex i to the next one of its ring
+    sg = np.empty((rings[-1], 2), dtype=np.int64)
+    sg[:, 0] = np.arange(rings[-1])
+    sg[:, 1] = sg[:, 0] + 1
+    sg[rings - 1, 1] = rings - np.asarray(lengths)
     # -- deal with holes
     if len(rings) > 1:
-        holes = np.zeros((len(rings) - 1, 2))
+        holes = np.empty((len(rings) - 1, 2))
         for k in range(len(rings) - 1):
             # -- basically triangulate the Triangle the Ring, and find the centre
             # -- of mass of the first triangle
             a = sfv2d[rings[k] : rings[k + 1]]
-            sg1 = np.zeros((a.shape[0], 2), dtype=np.int64)
-            for i, e in enumerate(sg1):
-                sg1[i][0] = i
-                sg1[i][1] = i + 1
-            sg1[-1][1] = 0
+            sg1 = np.empty((a.shape[0], 2), dtype=np.int64)
+            sg1[:, 0] = np.arange(a.shape[0])
+            sg1[:, 1] = sg1[:, 0] + 1
+            sg1[-1, 1] = 0
             pcl = dict(vertices=a, segments=sg1)
             trl = triangle.triangulate(pcl, "p")
             t = trl["triangles"][0]
-            c = np.average(a[t], axis=0)  # -- find its centre of mass
-            holes[k][0] = c[0]
-            holes[k][1] = c[1]
+            holes[k] = np.average(a[t], axis=0)  # -- find its centre of mass
         A = dict(vertices=sfv2d, segments=sg, holes=holes)
     else:
         A = dict(vertices=sfv2d, segments=sg)
@@ -158,20 +162,17 @@ def triangulate_face_shewchuk(face, vnp):
 
 
 def triangulate_face_mapbox_earcut(face, vnp):
-    sf = np.array([], dtype=np.int64)
     if (len(face) == 1) and (len(face[0]) == 3):
         return (np.array(face), True)
-    for ring in face:
-        sf = np.hstack((sf, np.array(ring)))
+    # -- all the rings in one array, rings holds the end index of each ring
+    lengths = [len(ring) for ring in face]
+    rings = np.cumsum(lengths, dtype=np.int32)
+    sf = np.empty(rings[-1], dtype=np.int64)
+    off = 0
+    for ring, length in zip(face, lengths):
+        sf[off : off + length] = ring
+        off += length
     sfv = vnp[sf]
-    # print(sf)
-    # print(sfv)
-    rings = np.zeros(len(face), dtype=np.int32)
-    total = 0
-    for i in range(len(face)):
-        total += len(face[i])
-        rings[i] = total
-    # print(rings)
 
     # 1. normal with Newell's method
     n, b = get_normal_newell(sfv)
@@ -182,13 +183,7 @@ def triangulate_face_mapbox_earcut(face, vnp):
     # print ("Newell:", n)
 
     # 2. project to the plane to get xy
-    sfv2d = np.zeros((sfv.shape[0], 2))
-    # print (sfv2d)
-    for i, p in enumerate(sfv):
-        xy = to_2d(p, n)
-        # print("xy", xy)
-        sfv2d[i][0] = xy[0]
-        sfv2d[i][1] = xy[1]
+    sfv2d = np.column_stack(to_2d(sfv, n))
     result = mapbox_earcut.triangulate_float64(sfv2d, rings)
     # print (result.reshape(-1, 3))
 
@@ -223,12 +218,33 @@ def triangle_normal(tri, vertexlist, weighted=False):
             return norm_vec * tri_area
 
 
+def triangle_normals(tris, vertexlist, weighted=False):
+    """Compute the normal vectors of all the triangles at once, like triangle_normal.
+
+    :param tris: the vertex indices of the triangles, array-like of shape (M, 3)
+    :param vertexlist: the array of the vertices
+    :returns: the (M, 3) array of the normals, and the boolean array of the
+        triangles whose normal could be computed (the others are zero)
+    """
+    p = np.asarray(vertexlist)[np.asarray(tris, dtype=np.int64).reshape(-1, 3)]
+    cross_prod = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    # -- the dot product of each row alone, to get the same bits as np.linalg.norm
+    c = cross_prod.astype(np.float64)
+    magnitude = np.sqrt((c[:, None, :] @ c[:, :, None])[:, 0, 0])
+    valid = magnitude != 0.0
+    normals = np.zeros(c.shape)
+    normals[valid] = cross_prod[valid] / magnitude[valid, None]
+    if weighted:
+        normals[valid] *= magnitude[valid, None] * 0.5
+    return (normals, valid)
+
+
 def average_normal(normals):
     """Compute the smooth (average) normal vector from a list of vectors.
     Returns a numpy array of [x,y,z]. If the normal cannot be computed, then it returns
     a fake normal of [1.0, 0.0, 0.0].
     """
-    s = sum(normals)
+    s = np.add.reduce(np.asarray(normals, dtype=np.float64).reshape(-1, 3), axis=0)
     n = np.linalg.norm(s)
     if math.isclose(n, 0.0):
         # Set a fake normal if length of the sum of normals is
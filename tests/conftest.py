@@ -31,17 +31,15 @@ def data_dir():
 
 
 @pytest.fixture(scope="function")
-def temp_texture_dir():
-    package_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    yield os.path.join(package_dir, "tests", "data", "rotterdam", "textures")
+def temp_texture_dir(tmp_path):
+    d = tmp_path / "textures"
+    d.mkdir()
+    yield str(d)
 
 
 @pytest.fixture(scope="function")
-def data_output_dir():
-    package_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    d = os.path.join(package_dir, "tmp")
-    os.makedirs(d, exist_ok=True)
-    yield d
+def data_output_dir(tmp_path):
+    yield str(tmp_path)
 
 
 @pytest.fixture(scope="function")
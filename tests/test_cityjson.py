@@ -2,9 +2,11 @@
 
 import pytest
 import copy
+from io import BytesIO
 from cjio import cityjson
 from math import isclose
 import json
+import os
 
 
 class TestCityJSON:
@@ -26,6 +28,15 @@ class TestCityJSON:
         expected = []
         assert set(expected).issubset(set(subset2.j["CityObjects"]))
 
+    def test_subset_inplace(self, zurich_subset):
+        ids = ["UUID_583c776f-5b0c-4d42-9c37-5b94e0c21a30"]
+        subset = zurich_subset.get_subset_ids(ids)
+        cm = zurich_subset.get_subset_ids(ids, inplace=True)
+        assert cm is zurich_subset
+        assert set(cm.j["CityObjects"]) == set(subset.j["CityObjects"])
+        assert len(cm.j["vertices"]) == len(subset.j["vertices"])
+        assert cm.get_bbox() == subset.get_bbox()
+
     def test_subset_bbox(self, delft):
         cm = delft
         extent = cm.j["metadata"]["geographicalExtent"]
@@ -109,6 +120,128 @@ class TestCityJSON:
 
         assert bbox == [100, 100, 100, 100.001, 100.001, 100.001]
 
+    def test_update_bbox_each_cityobjects(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [{"type": "MultiSurface", "boundaries": [[[0, 1, 2]]]}],
+                },
+                "b": {"type": "Building", "geometry": []},
+                "c": {
+                    "type": "Building",
+                    "geometry": [{"type": "MultiSurface", "boundaries": []}],
+                },
+            },
+            "vertices": [[0, 0, 0], [1, 0, 0], [1, 1, 1]],
+            "transform": {"scale": [0.5, 0.5, 0.5], "translate": [10, 10, 10]},
+        }
+        cm = cityjson.CityJSON(j=data)
+        cm.update_bbox_each_cityobjects(addifmissing=True)
+        cos = cm.j["CityObjects"]
+        assert cos["a"]["geographicalExtent"] == [10, 10, 10, 10.5, 10.5, 10.5]
+        # -- no vertex, no geographicalExtent
+        assert "geographicalExtent" not in cos["b"]
+        assert "geographicalExtent" not in cos["c"]
+
+    def test_flatten(self):
+        boundaries = [[[[0, 1, 2]], [[3, 4, 5], [6, 7, 8]]], [[[9, None, 10]]]]
+        assert list(cityjson.flatten(boundaries)) == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        assert list(cityjson.flatten([])) == []
+
+    def test_rings(self):
+        boundaries = [[[[0, 1, 2]], [[3, 4, 5], [6, 7, 8]]], [[[9, 10, 11]]]]
+        assert list(cityjson.rings(boundaries)) == [
+            [0, 1, 2],
+            [3, 4, 5],
+            [6, 7, 8],
+            [9, 10, 11],
+        ]
+        assert list(cityjson.rings([0, 1, 2])) == [[0, 1, 2]]
+
+    def test_update_indices_mixed_null(self):
+        values = [None, [0, 1], [[2, None], None]]
+        cityjson.update_geom_indices(values, 5)
+        assert values == [None, [5, 6], [[7, None], None]]
+        values = [[None, [0, 1]], [[2, 3, 4]], [[None]]]
+        cityjson.update_texture_indices(values, 10, 5)
+        assert values == [[None, [10, 6]], [[12, 8, 9]], [[None]]]
+
+    def test_remove_duplicate_vertices(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [
+                        {"type": "MultiSurface", "boundaries": [[[0, 1, 2, 3]]]}
+                    ],
+                }
+            },
+            "vertices": [[1, 1, 0], [0, 0, 0], [1, 1, 0], [0, 0, 0]],
+            "transform": {"scale": [1.0, 1.0, 1.0], "translate": [0, 0, 0]},
+        }
+        cm = cityjson.CityJSON(j=data)
+        assert cm.remove_duplicate_vertices() == 2
+        assert cm.j["vertices"] == [[1, 1, 0], [0, 0, 0]]
+        boundaries = cm.j["CityObjects"]["a"]["geometry"][0]["boundaries"]
+        assert boundaries == [[[0, 1, 0, 1]]]
+        # -- non-integer vertices with a transform are not truncated and merged
+        data["vertices"] = [[1, 1, 0], [0, 0, 0], [1.7, 1, 0], [0, 0, 0]]
+        cm = cityjson.CityJSON(j=data)
+        with pytest.raises(ValueError):
+            cm.remove_duplicate_vertices()
+        # -- integer-valued floats are packed into exact integer keys
+        data["vertices"] = [[1.0, 1, 0], [0, 0, 0], [1, 1.0, 0.0], [2, 0, 0]]
+        cm = cityjson.CityJSON(j=data)
+        assert cm.remove_duplicate_vertices() == 1
+        assert cm.j["vertices"] == [[1, 1, 0], [0, 0, 0], [2, 0, 0]]
+        assert all(isinstance(c, int) for v in cm.j["vertices"] for c in v)
+
+    def test_remap_and_compact_vertices(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [
+                        {"type": "MultiSurface", "boundaries": [[[4, 2, 0]], [[3, 1]]]}
+                    ],
+                }
+            },
+            "vertices": [
+                [1, 1, 0],
+                [0, 0, 0],
+                [9, 9, 9],
+                [1, 1, 0],
+                [5, 5, 5],
+                [7, 7, 7],
+            ],
+            "transform": {"scale": [1.0, 1.0, 1.0], "translate": [0, 0, 0]},
+        }
+        cm = cityjson.CityJSON(j=copy.deepcopy(data))
+        cm.remove_duplicate_vertices()
+        cm.remove_orphan_vertices()
+        cm2 = cityjson.CityJSON(j=copy.deepcopy(data))
+        assert cm2._remap_and_compact_vertices() == 2
+        assert cm2.j == cm.j
+        assert cm2.j["vertices"] == [[5, 5, 5], [9, 9, 9], [1, 1, 0], [0, 0, 0]]
+
+    def test_dumps(self):
+        data = {
+            "type": "CityJSON",
+            "metadata": {"geographicalExtent": [0.1234567, 0, 0, 1, 1, 1]},
+            "vertices": [[0.1234567, 1.0, 2.5], [1e-7, 0.0, 0.0]],
+        }
+        j = json.loads(cityjson.dumps(data))
+        assert j["vertices"] == [[0.123457, 1.0, 2.5], [0.0, 0.0, 0.0]]
+        assert j["metadata"]["geographicalExtent"][0] == 0.123457
+        assert data["vertices"][0][0] == 0.1234567
+        assert json.loads(cityjson.dumps(data, indent="\t")) == j
+        # -- ragged vertices are rounded one by one, non-ASCII is kept as is
+        data = {"name": "Zürich", "vertices": [[0.1234567, 1.0, 2.5], [1e-7, 0.0]]}
+        s = cityjson.dumps(data)
+        assert "Zürich" in s
+        assert json.loads(s)["vertices"] == [[0.123457, 1.0, 2.5], [0.0, 0.0]]
+
     def test_de_compression(self, delft):
         cm = copy.deepcopy(delft)
         assert cm.decompress()
@@ -128,6 +261,21 @@ class TestCityJSON:
         assert cubec.compress(2)
         assert len(cube.j["vertices"]) == len(cubec.j["vertices"])
 
+    def test_compress_rounding(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [{"type": "MultiPoint", "boundaries": [0, 1]}],
+                }
+            },
+            "vertices": [[0.005, 0.015, 0.125], [-0.0004, 1.0, 2.0]],
+        }
+        cm = cityjson.CityJSON(j=data)
+        assert cm.compress(2, translate=[0.0, 0.0, 0.0])
+        # -- same rounding as formatting the exact value with "%.2f"
+        assert cm.j["vertices"] == [[1, 1, 12], [0, 100, 200]]
+
     def test_reproject(self, delft_1b):
         cm = copy.deepcopy(delft_1b)
         cm.reproject(4937)  # -- z values should stay the same
@@ -188,10 +336,108 @@ class TestCityJSON:
         cm = copy.deepcopy(delft)
         _ = cm.export2stl(sloppy=True)
 
+    def test_convert_to_stl_normals(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [
+                        {
+                            "type": "MultiSurface",
+                            "lod": "1",
+                            "boundaries": [[[0, 1, 2, 3]]],
+                        }
+                    ],
+                }
+            },
+            "vertices": [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]],
+        }
+        cm = cityjson.CityJSON(j=data)
+        facets = cm.export2stl(sloppy=False).getvalue().split("endfacet\n")[:-1]
+        assert len(facets) == 2
+        for facet in facets:
+            assert "facet normal 0.000000 0.000000 1.000000\n" in facet
+
+    def test_convert_to_obj_faces(self, data_dir):
+        # -- the normal of each face must have the same bits as Newell's loop,
+        # -- else Triangle can insert a Steiner point and one face is dropped
+        p = os.path.join(data_dir, "dummy", "multisurface_with_material.json")
+        with open(p, "r") as f:
+            cm = cityjson.CityJSON(file=f)
+        obj = cm.export2obj(sloppy=False)
+        assert (
+            sum(1 for line in obj.getvalue().splitlines() if line.startswith("f "))
+            == 520
+        )
+
     def test_triangulate(self, materials):
         cm = materials
         cm.triangulate(sloppy=False)
 
+    def test_triangulate_solid_values(self):
+        data = {
+            "CityObjects": {
+                "a": {
+                    "type": "Building",
+                    "geometry": [
+                        {
+                            "type": "Solid",
+                            "lod": "1",
+                            "boundaries": [
+                                [[[0, 3, 2, 1]], [[4, 5, 6, 7]]],
+                                [[[0, 1, 5, 4]]],
+                            ],
+                            "semantics": {
+                                "surfaces": [{"type": "RoofSurface"}],
+                                "values": [[0, None], None],
+                            },
+                            "material": {"m": {"values": [[1, 2], [3]]}},
+                        }
+                    ],
+                }
+            },
+            "vertices": [
+                [0, 0, 0],
+                [1, 0, 0],
+                [1, 1, 0],
+                [0, 1, 0],
+                [0, 0, 1],
+                [1, 0, 1],
+                [1, 1, 1],
+                [0, 1, 1],
+            ],
+            "transform": {"scale": [1.0, 1.0, 1.0], "translate": [0, 0, 0]},
+        }
+        cm = cityjson.CityJSON(j=data)
+        cm.triangulate(sloppy=False)
+        geom = cm.j["CityObjects"]["a"]["geometry"][0]
+        assert [len(shell) for shell in geom["boundaries"]] == [4, 2]
+        assert geom["semantics"]["values"] == [[0, 0, None, None], None]
+        assert geom["material"]["m"]["values"] == [[1, 1, 2, 2], [3, 3]]
+
+    def test_triangulate_composite_solid_materials(self, data_dir):
+        p = os.path.join(data_dir, "dummy", "composite_solid_with_material.json")
+        with open(p, "r") as f:
+            cm = cityjson.CityJSON(file=f)
+        cm.triangulate(sloppy=False)
+        geom = cm.j["CityObjects"]["onebuilding"]["geometry"][0]
+        # -- each solid keeps its own materials
+        assert geom["material"]["irradiation"]["values"] == [
+            [[0, 0, 0, 0, 1, 1, None, None, 1, 1, 8, 8]],
+            [[0, 0, 1, 1, 1, 1, 2, 2, 3, 3, 4, 4]],
+        ]
+
+    def test_triangulate_texture_themes(self, dummy):
+        cm = dummy
+        cm.triangulate(sloppy=False)
+        geom = cm.j["CityObjects"]["102636712"]["geometry"][1]
+        # -- each theme keeps its own texture index
+        for theme, texture in (("winter-textures", 0), ("summer-textures", 1)):
+            values = geom["texture"][theme]["values"]
+            assert [len(shell) for shell in values] == [6, 3]
+            indices = {surface[0][0] for shell in values for surface in shell} - {None}
+            assert indices == {texture}
+
     def test_is_triangulate(self, triangulated):
         cm = triangulated
         assert cm.is_triangulated()
@@ -206,6 +452,11 @@ class TestCityJSON:
 
             assert "CityObjects" in data
 
+    def test_convert_to_jsonl_binary(self, rotterdam_subset):
+        jsonl = copy.deepcopy(rotterdam_subset).export2jsonl()
+        jsonl_b = copy.deepcopy(rotterdam_subset).export2jsonl(BytesIO())
+        assert jsonl_b.getvalue().decode("utf-8") == jsonl.getvalue()
+
     def test_filter_lod(self, multi_lod):
         cm = multi_lod
         cm.filter_lod("1.3")
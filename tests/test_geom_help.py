@@ -0,0 +1,41 @@
+"""Test the geometry helpers"""
+
+import numpy as np
+
+from cjio import geom_help
+
+
+class TestNormal:
+    def test_normal_newell(self):
+        # -- a square in the xz plane, with a collinear extra point
+        poly = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [2, 0, 2], [0, 0, 2]]
+        n, b = geom_help.get_normal_newell(poly)
+        assert b
+        assert np.allclose(n, [0.0, -1.0, 0.0])
+
+    def test_normal_newell_degenerate(self):
+        n, b = geom_help.get_normal_newell([[0, 0, 0], [1, 1, 1], [2, 2, 2]])
+        assert not b
+        assert not n.any()
+        n, b = geom_help.get_normal_newell([[0, 0, 0], [1, 1, 1]])
+        assert not b
+        assert n.shape == (3,) and not n.any()
+        # -- 2D points are rejected, not read as 3D ones
+        n, b = geom_help.get_normal_newell(
+            [[0, 0], [1, 0], [1, 1], [0, 1], [0, 2], [1, 2]]
+        )
+        assert not b
+        assert n.shape == (3,) and not n.any()
+
+    def test_triangle_normals(self):
+        vertices = np.array([[0, 0, 0], [2, 0, 0], [0, 2, 0], [0, 0, 2], [4, 0, 0]])
+        # -- the last triangle is degenerate
+        tris = [[0, 1, 2], [0, 3, 1], [0, 1, 4]]
+        normals, valid = geom_help.triangle_normals(tris, vertices, weighted=True)
+        assert valid.tolist() == [True, True, False]
+        for t, n in zip(tris[:2], normals):
+            assert np.array_equal(
+                n, geom_help.triangle_normal(t, vertices, weighted=True)
+            )
+        assert np.array_equal(normals[0], [0.0, 0.0, 2.0])
+        assert not normals[2].any()